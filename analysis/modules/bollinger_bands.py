@@ -1,5 +1,6 @@
 import pandas as pd
 from utils.utilities import get_engine
+from utils.prices import listing_info, read_prices
 from datetime import datetime
 def bollinger_bands_analysis(stock_code : str, period : int = 20, multiplier : int = 2) -> pd.DataFrame:
     """Provide an analysis of stock code using Bollinger bands
@@ -16,35 +17,13 @@ def bollinger_bands_analysis(stock_code : str, period : int = 20, multiplier : i
     # acquire stock data from database
     engine = get_engine()
 
-    query = f"""
-        SELECT
-            first_transaction_date
-        FROM
-            public.stock_info
-        WHERE
-            stock_code = '{stock_code}'
-    """
     # Get the most current transaction date
-    df = pd.read_sql_query(query, engine)['first_transaction_date']
-    start_date = df.max()
+    start_date = listing_info([stock_code], engine)[stock_code]['first_transaction_date']
     end_date = datetime.today().date()
 
     # Query close data
-    stock_query = f"""
-        SELECT
-            date,
-            close_price
-        FROM public.transaction
-        WHERE
-            stock_code = '{stock_code}'
-            AND
-            date >= DATE '{start_date}'
-            AND
-            date <= DATE '{end_date}'
-        ORDER BY date
-    """
     print("Query data")
-    df = pd.read_sql_query(stock_query, engine)
+    df = read_prices(stock_code, ['date', 'close_price'], start_date, end_date, engine)
 
     df.index = df['date']
     df = df.drop('date', axis = 1).sort_index()
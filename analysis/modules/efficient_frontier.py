@@ -1,5 +1,4 @@
 import numpy as np
-import pandas as pd
 from typing import List
 import matplotlib.pyplot as plt
 from pypfopt.efficient_frontier import EfficientFrontier
@@ -8,6 +7,8 @@ from pypfopt import plotting as ef_plotting
 from datetime import datetime, timedelta
 
 from utils.utilities import get_engine
+from utils.prices import listing_info
+from utils.panel import close_panel
 
 def ef_random_portfolio(stock_codes : List[str],risk_free_rate : float = 0.06):
     """Calculate portfolio with selected efficient frontier
@@ -18,52 +19,15 @@ def ef_random_portfolio(stock_codes : List[str],risk_free_rate : float = 0.06):
     """
     engine = get_engine()
 
-    # Get first transaction date of the stocks
-    query = f"""
-        SELECT 
-            first_transaction_date
-        FROM public.stock_info
-        WHERE
-            stock_code IN {tuple(stock_codes)}
-    """
-    # Get the most current transaction date
-    df = pd.read_sql_query(query, engine)['first_transaction_date']
-    start_date = df.max()
+    # Get the most current first transaction date of the stocks
+    listings = listing_info(stock_codes, engine)
+    start_date = max(listing['first_transaction_date'] for listing in listings.values())
     end_date = datetime.today().date()
 
-    # Query stock data 
-    stock_query = f"""
-        SELECT
-            stock_code,
-            date,
-            close_price
-        FROM public.transaction
-        WHERE
-            stock_code IN {tuple(stock_codes)}
-            AND
-            date >= DATE '{start_date}'
-            AND
-            date <= DATE '{end_date}'
-        ORDER BY date
-    """
+    # Query the close prices of every stock in one round trip, as a matrix in which columns are stock,
+    # rows are date (only the dates where every stock has a price), and each cell is the close_price
     print("Query data")
-    df = pd.read_sql_query(stock_query, engine)
-
-    # Convert to appropriate format, in which columns are stock, rows are date, and each cell is the close_price
-    print("Convert data to close format")
-    close_data = None
-    for stock in stock_codes:
-        stock_data = df[df['stock_code'] == stock][['date', 'close_price']]
-        stock_data.index = stock_data['date']
-        stock_data = stock_data.drop('date', axis = 1).sort_index()
-        stock_data = stock_data.rename(columns = {
-            'close_price' : stock
-        })
-        if close_data is None:
-            close_data = stock_data
-        else:
-            close_data = close_data.merge(stock_data, how = 'outer', left_index = True, right_index = True)
-    close_data = close_data.dropna()
+    close_data = close_panel(stock_codes, start_date, end_date, align = 'inner', dtype = 'float64', engine = engine).to_frame()
 
     # Begin calculation
     print("Begin calculation")
@@ -1,4 +1,3 @@
-import pandas as pd
 import matplotlib.pyplot as plt
 from datetime import datetime
 from dateutil.relativedelta import relativedelta
@@ -7,6 +6,7 @@ import matplotlib
 import matplotlib.dates as mdates
 
 from utils.utilities import get_engine
+from utils.prices import read_prices
 
 def fibonacci_retracement_strategy(stock_code : str, day_interval : int = 252):
     """A Fibonacci retracement approach
@@ -21,24 +21,7 @@ def fibonacci_retracement_strategy(stock_code : str, day_interval : int = 252):
     end_date = datetime.today().date()
     start_date = end_date - relativedelta(days = day_interval)
 
-    query = f"""
-        SELECT
-            stock_code,
-            date,
-            open_price,
-            highest_price,
-            lowest_price,
-            close_price
-        FROM public.transaction
-        WHERE 
-            stock_code = '{stock_code}'
-            AND
-            date >= DATE '{start_date}'
-            AND
-            date <= DATE '{end_date}'
-        ORDER BY date
-    """
-    df = pd.read_sql_query(query, engine)
+    df = read_prices(stock_code, ['stock_code', 'date', 'open_price', 'highest_price', 'lowest_price', 'close_price'], start_date, end_date, engine)
     df.reset_index(drop = True, inplace = True) # to make sure that loc and iloc is the same
 
     # calculate highest and lowest swing
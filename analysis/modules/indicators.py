@@ -3,6 +3,7 @@ from datetime import datetime, timedelta
 import talib
 
 from utils.utilities import get_engine
+from utils.prices import read_prices
 
 def momentum_indicators(stock_code : str, day_interval : int = 252, lookback_window : int = 7) -> pd.DataFrame:
     """calculate indicators relating to momentum
@@ -20,23 +21,8 @@ def momentum_indicators(stock_code : str, day_interval : int = 252, lookback_win
     end_date = datetime.today().date()
     start_date = end_date - timedelta(days = day_interval)
 
-    stock_query = f"""
-        SELECT
-            date,
-            highest_price,
-            lowest_price,
-            close_price
-        FROM public.transaction
-        WHERE
-            stock_code = '{stock_code}'
-            AND
-            date >= DATE '{start_date}'
-            AND
-            date <= DATE '{end_date}'
-        ORDER BY date
-    """
     print("Query data")
-    df = pd.read_sql_query(stock_query, engine)
+    df = read_prices(stock_code, ['date', 'highest_price', 'lowest_price', 'close_price'], start_date, end_date, engine)
 
     # initializing dataframe
     indicators = pd.DataFrame(index = df['date'])
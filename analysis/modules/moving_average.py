@@ -1,6 +1,7 @@
 import pandas as pd
 from datetime import datetime
 from utils.utilities import get_engine
+from utils.prices import listing_info, read_prices
 
 def moving_average_analysis(stock_code : str, investment_preference : list) -> pd.DataFrame:
     """Analyze stock data using Moving Average Analysis
@@ -23,32 +24,11 @@ def moving_average_analysis(stock_code : str, investment_preference : list) -> p
 
     engine = get_engine()
     # Get start date of stock code
-    stock_query = f"""
-        SELECT 
-            first_transaction_date
-        FROM public.stock_info
-        WHERE
-            stock_code = '{stock_code}'
-    """
-    first_transaction_date = pd.read_sql_query(stock_query, engine).iloc[0]['first_transaction_date']
+    first_transaction_date = listing_info([stock_code], engine)[stock_code]['first_transaction_date']
 
     # query all data of the stock code since the first transaction date
     today = datetime.today().date()
-    query = f"""
-        SELECT
-            date,
-            close_price,
-            volume
-        FROM public.transaction
-        WHERE
-            date >= DATE '{first_transaction_date}'
-            AND
-            date <= DATE '{today}'
-            AND
-            stock_code = '{stock_code}'
-        ORDER BY date
-    """
-    df = pd.read_sql_query(query, engine)
+    df = read_prices(stock_code, ['date', 'close_price', 'volume'], first_transaction_date, today, engine)
 
     moving_average_windows = [item for t in investment_preference for item in t]
 
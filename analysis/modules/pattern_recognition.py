@@ -1,6 +1,7 @@
 import pandas as pd
 import talib
 from utils.utilities import get_engine
+from utils.prices import read_prices
 from datetime import datetime
 from dateutil.relativedelta import relativedelta
 
@@ -25,24 +26,7 @@ def candlestick_patterns(stock_code: str, day_interval : int = 120, lookback_win
     end_date = datetime.today().date()
     start_date = end_date - relativedelta(days = day_interval)
 
-    query = f"""
-        SELECT
-            stock_code,
-            date,
-            open_price,
-            highest_price,
-            lowest_price,
-            close_price
-        FROM public.transaction
-        WHERE 
-            stock_code = '{stock_code}'
-            AND
-            date >= DATE '{start_date}'
-            AND
-            date <= DATE '{end_date}'
-        ORDER BY date
-    """
-    stock_data = pd.read_sql_query(query, engine)
+    stock_data = read_prices(stock_code, ['stock_code', 'date', 'open_price', 'highest_price', 'lowest_price', 'close_price'], start_date, end_date, engine)
     stock_data = stock_data.rename(columns = {
         'open_price' : 'open',
         'close_price' : 'close',
@@ -0,0 +1,185 @@
+import io
+import os
+import threading
+import time
+import zipfile
+from datetime import timedelta
+from functools import partial
+from http.server import ThreadingHTTPServer, SimpleHTTPRequestHandler
+
+import numpy as np
+import pandas as pd
+
+from tasks.daily_transaction import DailyTransaction
+
+CAFEF_HEADER = ['<Ticker>', '<DTYYYYMMDD>', '<Open>', '<High>', '<Low>', '<Close>', '<Volume>']
+
+def synthetic_tickers(n_tickers : int) -> list:
+    """Three letter stock codes, AAA, AAB, ...
+    """
+    letters = 'ABCDEFGHIJKLMNOPQRSTUVWXYZ'
+    return [letters[i // 676 % 26] + letters[i // 26 % 26] + letters[i % 26] for i in range(n_tickers)]
+
+def trading_days(end_date, n_years : int) -> pd.DatetimeIndex:
+    """Weekdays of the n_years before end_date, end_date included
+    """
+    start_date = end_date - timedelta(days = 365 * n_years)
+    return pd.bdate_range(start_date, end_date)
+
+def synthetic_prices(tickers : list, days : pd.DatetimeIndex, seed : int = 0) -> pd.DataFrame:
+    """Random walk OHLCV rows in CafeF format, sorted like CafeF files (ticker, then newest date first)
+    """
+    rng = np.random.default_rng(seed)
+    n_days = len(days)
+    n_rows = len(tickers) * n_days
+    returns = rng.normal(0, 0.02, size = (len(tickers), n_days))
+    close = np.round(rng.uniform(5, 100, size = (len(tickers), 1)) * np.exp(np.cumsum(returns, axis = 1)), 2).ravel()
+    spread = np.abs(rng.normal(0, 0.01, size = n_rows))
+    dates = days.strftime('%Y%m%d').astype(int).to_numpy()
+    df = pd.DataFrame({
+        '<Ticker>' : np.repeat(tickers, n_days),
+        '<DTYYYYMMDD>' : np.tile(dates, len(tickers)),
+        '<Open>' : np.round(close * (1 + rng.normal(0, 0.005, size = n_rows)), 2),
+        '<High>' : np.round(close * (1 + spread), 2),
+        '<Low>' : np.round(close * (1 - spread), 2),
+        '<Close>' : close,
+        '<Volume>' : rng.integers(0, 5000000, size = n_rows)
+    })
+    return df.sort_values(['<Ticker>', '<DTYYYYMMDD>'], ascending = [True, False], ignore_index = True)
+
+def _write_member(archive : zipfile.ZipFile, name : str, df : pd.DataFrame):
+    with archive.open(name, 'w') as f:
+        with io.TextIOWrapper(f, encoding = 'utf-8', newline = '') as text_file:
+            df.to_csv(text_file, index = False, header = CAFEF_HEADER)
+
+def _archive_path(root : str, url_format : str, date) -> str:
+    relative = url_format.format('', date.strftime('%Y%m%d'), date.strftime('%d%m%Y')).lstrip('/')
+    path = os.path.join(root, relative)
+    os.makedirs(os.path.dirname(path), exist_ok = True)
+    return path
+
+def write_archives(root : str, end_date, n_tickers : int = 1600, n_years : int = 15, eod_days : int = 5, seed : int = 0) -> dict:
+    """Write CafeF-format Upto and EOD archives under root, laid out like the ami_data folders
+
+    Tickers are split evenly over HNX, HSX and UPCOM. The Upto archives of end_date hold the whole history and
+    an EOD archive is written for each of the last eod_days trading days.
+
+    Args:
+        root (str): folder to serve, i.e. the base url of DailyTransaction
+        end_date (datetime.date): date of the Upto archives
+        n_tickers (int, optional): number of stock codes. Defaults to 1600.
+        n_years (int, optional): years of history. Defaults to 15.
+        eod_days (int, optional): number of EOD archives. Defaults to 5.
+        seed (int, optional): random seed. Defaults to 0.
+
+    Returns:
+        dict: 'tickers' per stock exchange, 'rows' per csv member and 'bytes' per archive path
+    """
+    tickers = synthetic_tickers(n_tickers)
+    exchanges = DailyTransaction.STOCK_EXCHANGES
+    days = trading_days(end_date, n_years)
+    eod_dates = [d.date() for d in days[-eod_days:]] if eod_days > 0 else []
+    day, month, year = str(end_date.day).zfill(2), str(end_date.month).zfill(2), end_date.year
+    result = {'tickers' : {}, 'rows' : {}, 'bytes' : {}}
+
+    eod_archives = {
+        date : zipfile.ZipFile(_archive_path(root, DailyTransaction.EOD_TRANSACTION_FORMAT_URL, date), 'w', zipfile.ZIP_DEFLATED)
+        for date in eod_dates
+    }
+    upto_path = _archive_path(root, DailyTransaction.UP_TO_TRANSACTION_FORMAT_URL, end_date)
+    with zipfile.ZipFile(upto_path, 'w', zipfile.ZIP_DEFLATED) as upto:
+        for i, exchange in enumerate(exchanges):
+            exchange_tickers = tickers[i::len(exchanges)]
+            result['tickers'][exchange] = exchange_tickers
+            df = synthetic_prices(exchange_tickers, days, seed = seed + i)
+            name = DailyTransaction.UPTO_FILE_FORMAT.format(exchange, day, month, year)
+            _write_member(upto, name, df)
+            result['rows'][name] = len(df)
+            for date, archive in eod_archives.items():
+                eod_name = DailyTransaction.EOD_FILE_FORMAT.format(exchange, str(date.day).zfill(2), str(date.month).zfill(2), date.year)
+                _write_member(archive, eod_name, df[df['<DTYYYYMMDD>'] == int(date.strftime('%Y%m%d'))])
+    for archive in eod_archives.values():
+        archive.close()
+    result['bytes'][upto_path] = os.path.getsize(upto_path)
+
+    index_df = synthetic_prices(DailyTransaction.STOCK_INDEXES, days, seed = seed + len(exchanges))
+    index_path = _archive_path(root, DailyTransaction.UPTO_INDEX_FORMAT_URL, end_date)
+    with zipfile.ZipFile(index_path, 'w', zipfile.ZIP_DEFLATED) as archive:
+        name = DailyTransaction.UPTO_INDEX_FILE_FORMAT_URL.format(day, month, year)
+        _write_member(archive, name, index_df)
+        result['rows'][name] = len(index_df)
+    result['bytes'][index_path] = os.path.getsize(index_path)
+    for date in eod_dates:
+        path = _archive_path(root, DailyTransaction.EOD_INDEX_FORMAT_URL, date)
+        with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as archive:
+            name = DailyTransaction.EOD_INDEX_FILE_FORMAT_URL.format(str(date.day).zfill(2), str(date.month).zfill(2), date.year)
+            _write_member(archive, name, index_df[index_df['<DTYYYYMMDD>'] == int(date.strftime('%Y%m%d'))])
+    return result
+
+class _QuietHandler(SimpleHTTPRequestHandler):
+    def __init__(self, *args, server_state = None, **kwargs):
+        self.server_state = server_state
+        super().__init__(*args, **kwargs)
+
+    def do_GET(self):
+        state = self.server_state
+        if state['delay'] > 0:
+            time.sleep(state['delay'])
+        with state['lock']:
+            state['requests'].append(self.path)
+            failures = state['failures'].get(self.path, 0)
+            if failures > 0:
+                state['failures'][self.path] = failures - 1
+        if failures > 0:
+            self.send_error(503)
+            return
+        super().do_GET()
+
+    def log_message(self, format, *args):
+        pass
+
+class CafeFServer(object):
+    """Serve a folder written by write_archives over HTTP on localhost, as a stand-in for cafef1.mediacdn.vn
+
+    Usage:
+        with CafeFServer(root) as server:
+            DailyTransaction(base_url = server.base_url)
+    """
+    def __init__(self, root : str, port : int = 0, delay : float = 0.0, failures : dict = None):
+        """
+        Args:
+            root (str): folder to serve
+            port (int, optional): port, 0 for any free port. Defaults to 0.
+            delay (float, optional): seconds before every response, to simulate latency. Defaults to 0.0.
+            failures (dict, optional): {url path : number of 503 answers before the file is served}. Defaults to None.
+        """
+        self.root = root
+        self._state = {'delay' : delay, 'failures' : dict(failures or {}), 'requests' : [], 'lock' : threading.Lock()}
+        self._server = ThreadingHTTPServer(('127.0.0.1', port), partial(_QuietHandler, directory = root, server_state = self._state))
+        self._thread = threading.Thread(target = self._server.serve_forever, daemon = True)
+
+    @property
+    def requests(self) -> list:
+        """Url paths requested so far, failed attempts included
+        """
+        with self._state['lock']:
+            return list(self._state['requests'])
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
@@ -0,0 +1,126 @@
+import argparse
+import io
+import os
+import tempfile
+import time
+import urllib.request
+from datetime import datetime
+
+import pandas as pd
+from sqlalchemy import text
+
+from benchmarks.cafef_server import CafeFServer, write_archives
+from tasks.daily_transaction import DailyTransaction
+from utils.cafef import open_archive, read_cafef_csv
+from utils.download_cache import DownloadCache
+from utils.utilities import get_engine
+
+def _print_result(stage : str, rows : int, seconds : float, size : int = None):
+    seconds = max(seconds, 1e-9)
+    throughput = f"{rows / seconds:>12.0f} rows/s" if rows is not None else ' ' * 19
+    megabytes = f"{size / seconds / 1024 / 1024:>8.1f} MB/s" if size is not None else ''
+    print(f"{stage:<24}{seconds:>10.3f}s {throughput} {megabytes}")
+
+def bench_download(url : str):
+    """Download url once
+
+    Returns:
+        tuple: (content, seconds)
+    """
+    start = time.perf_counter()
+    with urllib.request.urlopen(url) as f:
+        content = f.read()
+    return content, time.perf_counter() - start
+
+def bench_parse(content : bytes, member : str, ticker_column : str):
+    """Parse one csv member of an archive with the ingestion reader
+
+    Returns:
+        tuple: (list of frames, seconds)
+    """
+    start = time.perf_counter()
+    with open_archive(content) as archive:
+        frames = list(read_cafef_csv(archive, member, ticker_column))
+    return frames, time.perf_counter() - start
+
+def csv_loader(frames, stock_exchange):
+    """Stand-in loader without a database: serializes the frames as the COPY loader does
+    """
+    for df in frames:
+        buffer = io.StringIO()
+        df.assign(stock_exchange = stock_exchange)[DailyTransaction.TRANSACTION_COLUMNS].to_csv(buffer, index = False, header = False, date_format = '%Y-%m-%d')
+
+# the rows loaded by the benchmark are not tied to an archive, so no ingestion_coverage row is written for them
+NO_COVERAGE = pd.DataFrame(columns = ['feed', 'archive_hash', 'first_date', 'last_date', 'row_count'])
+
+def postgres_loader(ds : DailyTransaction):
+    """Loader writing to the database of ds with its configured load mode
+    """
+    def load(frames, stock_exchange):
+        for df in frames:
+            ds._load_transaction(df.assign(stock_exchange = stock_exchange), stock_exchange, NO_COVERAGE)
+    return load
+
+def seed_stock_info(engine, tickers : dict, first_date):
+    """Register the synthetic stock codes, otherwise every row ends up in quarantine
+    """
+    with engine.begin() as connection:
+        for stock_exchange, codes in tickers.items():
+            for code in codes:
+                connection.execute(text("""
+                    INSERT INTO public.stock_info
+                    VALUES (:company_name, 0, :first_date, :stock_code, 0, :stock_exchange)
+                    ON CONFLICT ON CONSTRAINT stock_info_pkey DO NOTHING"""),
+                    company_name = f'Benchmark {code}',
+                    first_date = first_date,
+                    stock_code = code,
+                    stock_exchange = stock_exchange
+                )
+
+def run(n_tickers : int, n_years : int, loader : str, load_mode : str, end_to_end : bool, seed_codes : bool):
+    end_date = datetime.today().date()
+    with tempfile.TemporaryDirectory() as root:
+        start = time.perf_counter()
+        archives = write_archives(root, end_date, n_tickers = n_tickers, n_years = n_years)
+        print(f"Generated {sum(archives['rows'].values())} rows ({sum(archives['bytes'].values()) / 1024 / 1024:.1f} MB zipped) in {time.perf_counter() - start:.1f}s")
+
+        engine = get_engine() if loader == 'postgres' or end_to_end else None
+        if engine is not None and seed_codes:
+            seed_stock_info(engine, archives['tickers'], end_date)
+
+        with CafeFServer(root) as server:
+            ds = DailyTransaction(load_mode = load_mode, base_url = server.base_url, engine = engine, update_mode = 'upto',
+                cache = DownloadCache(os.path.join(root, '.download_cache')))
+            url = ds._archive_url(DailyTransaction.UP_TO_TRANSACTION_FORMAT_URL, end_date)
+
+            print(f"{'stage':<24}{'time':>11} {'throughput':>19}")
+            content, seconds = bench_download(url)
+            _print_result('download', None, seconds, len(content))
+
+            load = csv_loader if loader == 'csv' else postgres_loader(ds)
+            day, month, year = str(end_date.day).zfill(2), str(end_date.month).zfill(2), end_date.year
+            for stock_exchange in DailyTransaction.STOCK_EXCHANGES:
+                member = DailyTransaction.UPTO_FILE_FORMAT.format(stock_exchange, day, month, year)
+                frames, seconds = bench_parse(content, member, 'stock_code')
+                rows = sum(len(df) for df in frames)
+                _print_result(f'parse {stock_exchange}', rows, seconds)
+                start = time.perf_counter()
+                load(frames, stock_exchange)
+                _print_result(f'load {stock_exchange} ({loader})', rows, time.perf_counter() - start)
+
+            if end_to_end:
+                print("End to end run")
+                ds.work()
+                ds.report.print_summary()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = 'Benchmark the CafeF ingestion on synthetic archives served from localhost')
+    parser.add_argument('--tickers', type = int, default = 300, help = 'number of synthetic stock codes')
+    parser.add_argument('--years', type = int, default = 5, help = 'years of synthetic history')
+    parser.add_argument('--loader', choices = ['csv', 'postgres'], default = 'csv',
+        help = 'csv: serialize the rows without a database, postgres: load into the database of conf/db_config.yml')
+    parser.add_argument('--load-mode', choices = DailyTransaction.LOAD_MODES, default = 'bulk')
+    parser.add_argument('--end-to-end', action = 'store_true', help = 'also run DailyTransaction.work() against the local server')
+    parser.add_argument('--seed-stock-info', action = 'store_true', help = 'insert the synthetic stock codes into stock_info first')
+    args = parser.parse_args()
+    run(args.tickers, args.years, args.loader, args.load_mode, args.end_to_end, args.seed_stock_info)
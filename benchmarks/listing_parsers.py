@@ -0,0 +1,162 @@
+import argparse
+import contextlib
+import io
+import json
+import math
+import tempfile
+import time
+
+import numpy as np
+
+from tasks.listing_api import HNXHttpBackend, HSXHttpBackend, ListingHttpBackend, UPCOMHttpBackend, listing_frame
+from tasks.listing_fixtures import RecordingSession, ReplaySession
+
+BACKENDS = [HSXHttpBackend, HNXHttpBackend, UPCOMHttpBackend]
+# cell positions of (company_name, free_float, first_transaction_date, stock_code, listing_volume) on the real pages,
+# as read by the selenium scrapers; the synthetic pages follow them rather than the CELLS of the backends under test
+PAGE_CELLS = {'HSX' : (4, 6, 7, 1, 5), 'HNX' : (2, 6, 4, 1, 5), 'UPCOM' : (2, 5, 3, 1, 4)}
+
+def _vn_number(value : int) -> str:
+    return f"{value:,}".replace(',', '.')
+
+class SyntheticListingSession(object):
+    """Answer the listing endpoints with generated pages, in the formats of hsx.vn and hnx.vn
+
+    Only used to record fixtures when no real snapshots are available.
+    """
+    def __init__(self, n_rows : int, seed : int = 0):
+        rng = np.random.default_rng(seed)
+        self.n_rows = n_rows
+        self.volumes = rng.integers(1000000, 5000000000, size = n_rows)
+        self.free_floats = (self.volumes * rng.uniform(0.1, 1.0, size = n_rows)).astype(int)
+        self.days = rng.integers(0, 8000, size = n_rows)
+
+    def _page(self, page : int) -> range:
+        start = (page - 1) * ListingHttpBackend.PAGE_SIZE
+        return range(start, min(start + ListingHttpBackend.PAGE_SIZE, self.n_rows))
+
+    def _total_pages(self) -> int:
+        return max(1, math.ceil(self.n_rows / ListingHttpBackend.PAGE_SIZE))
+
+    def _values(self, i : int) -> dict:
+        date = np.datetime64('2000-07-28') + np.timedelta64(int(self.days[i]), 'D')
+        return {
+            'stock_code' : f'S{i:05d}',
+            'company_name' : f'Cong ty co phan {i}',
+            'first_transaction_date' : date.astype(object).strftime('%d/%m/%Y'),
+            'listing_volume' : _vn_number(int(self.volumes[i])),
+            'free_float' : _vn_number(int(self.free_floats[i]))
+        }
+
+    def cells(self, i : int, positions : tuple) -> list:
+        """Cell texts of row i with the fields at positions, like a table read in the browser
+        """
+        values = self._values(i)
+        row = [str(i)] * (max(positions) + 2)
+        for field, position in zip(['company_name', 'free_float', 'first_transaction_date', 'stock_code', 'listing_volume'], positions):
+            row[position] = values[field]
+        return row
+
+    def get(self, url, params = None, **kwargs):
+        # jqGrid endpoint of hsx.vn
+        page = int(params['page'])
+        rows = []
+        for i in self._page(page):
+            cells = self.cells(i, PAGE_CELLS['HSX'])
+            cells[1] = f'<a href="/Modules/Listed/Web/SymbolView?id={i}">{cells[1]}</a>'
+            rows.append({'id' : i, 'cell' : cells})
+        content = json.dumps({'page' : page, 'total' : self._total_pages(), 'records' : self.n_rows, 'rows' : rows})
+        return _SyntheticResponse(content.encode('utf-8'))
+
+    def post(self, url, data = None, **kwargs):
+        # html fragment endpoints of hnx.vn
+        positions = PAGE_CELLS['UPCOM'] if url == UPCOMHttpBackend.URL else PAGE_CELLS['HNX']
+        lines = ['<table><tbody>']
+        for i in self._page(int(data['pCurrentPage'])):
+            cells = self.cells(i, positions)
+            lines.append('<tr>' + ''.join(f'<td><a>{cell}</a></td>' for cell in cells) + '</tr>')
+        lines.append('</tbody></table>')
+        content = json.dumps({'Content' : ''.join(lines), 'TotalPage' : self._total_pages()})
+        return _SyntheticResponse(content.encode('utf-8'))
+
+class _SyntheticResponse(object):
+    def __init__(self, content : bytes):
+        self.content = content
+
+    def raise_for_status(self):
+        pass
+
+class _CountingReplaySession(ReplaySession):
+    def __init__(self, root : str):
+        super().__init__(root)
+        self.pages = 0
+
+    def _request(self, *args, **kwargs):
+        self.pages += 1
+        return super()._request(*args, **kwargs)
+
+def _print_result(parser : str, pages : int, rows : int, seconds : float):
+    seconds = max(seconds, 1e-9)
+    print(f"{parser:<28}{pages:>8}{rows:>10}{seconds:>10.3f}s{pages / seconds:>12.1f} pages/s{rows / seconds:>14.0f} rows/s")
+
+def record(root : str, n_rows : int):
+    """Record the synthetic responses of every backend under root
+    """
+    session = SyntheticListingSession(n_rows)
+    with contextlib.redirect_stdout(io.StringIO()):
+        for backend in BACKENDS:
+            backend(session = RecordingSession(root, session = session)).fetch()
+
+def bench_backend(root : str, backend, repeat : int):
+    """Replay the recorded responses of backend through its parser
+
+    Returns:
+        tuple: (pages, rows, seconds) over all the repeats
+    """
+    session = _CountingReplaySession(root)
+    rows = 0
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        for _ in range(repeat):
+            rows += len(backend(session = session).fetch())
+    return session.pages, rows, time.perf_counter() - start
+
+def bench_browser_rows(n_rows : int, rows_per_page : int, repeat : int):
+    """Parse the cell texts the selenium backend reads with execute_script, rows_per_page rows per page
+
+    Returns:
+        tuple: (pages, rows, seconds) over all the repeats
+    """
+    session = SyntheticListingSession(n_rows)
+    rows = [session.cells(i, PAGE_CELLS['HNX']) for i in range(n_rows)]
+    pages = math.ceil(n_rows / rows_per_page)
+    start = time.perf_counter()
+    for _ in range(repeat):
+        parsed = listing_frame(rows, HNXHttpBackend.CELLS, 'HNX')
+    return pages * repeat, len(parsed) * repeat, time.perf_counter() - start
+
+def run(n_rows : int, repeat : int, fixtures : str = None, rows_per_page : int = 20):
+    with tempfile.TemporaryDirectory() as tmp:
+        root = fixtures
+        if root is None:
+            root = tmp
+            start = time.perf_counter()
+            record(root, n_rows)
+            print(f"Recorded synthetic responses of {n_rows} listings per backend in {time.perf_counter() - start:.2f}s")
+        print(f"{'parser':<28}{'pages':>8}{'rows':>10}{'time':>11}{'':>19}")
+        for backend in BACKENDS:
+            try:
+                _print_result(backend.__name__, *bench_backend(root, backend, repeat))
+            except FileNotFoundError as e:
+                print(f"{backend.__name__:<28}skipped: {e}")
+        if fixtures is None:
+            _print_result('browser rows', *bench_browser_rows(n_rows, rows_per_page, repeat))
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = 'Benchmark the listing parsers on recorded responses, without browser nor network')
+    parser.add_argument('--rows', type = int, default = 2000, help = 'number of synthetic listings per backend')
+    parser.add_argument('--repeat', type = int, default = 5, help = 'number of times every backend parses the responses')
+    parser.add_argument('--fixtures', default = None,
+        help = 'folder of responses recorded with the --fixtures option of the scrapers, instead of synthetic ones')
+    args = parser.parse_args()
+    run(args.rows, args.repeat, args.fixtures)
@@ -0,0 +1,73 @@
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from utils.panel import ALIGNMENTS, build_panel
+
+def synthetic_series(n_tickers : int, years : int, seed : int = 0):
+    """Close prices of n_tickers on business days, each listed at a random date and missing 2% of the sessions
+
+    Returns:
+        list: (stock_code, dates, prices) of every stock code
+    """
+    rng = np.random.default_rng(seed)
+    calendar = pd.bdate_range(end = '2022-12-30', periods = years * 252).values.astype('datetime64[D]')
+    series = []
+    for i in range(n_tickers):
+        first = rng.integers(0, len(calendar) // 2)
+        dates = calendar[first:][rng.random(len(calendar) - first) > 0.02]
+        prices = 10000 * np.exp(np.cumsum(rng.normal(0, 0.02, size = len(dates))))
+        series.append((f"T{i:04d}", dates, prices))
+    return series
+
+def legacy_merge(series) -> pd.DataFrame:
+    """Close matrix of ef_random_portfolio before the panel builder: one outer merge per stock code
+    """
+    close_data = None
+    for stock_code, dates, prices in series:
+        stock_data = pd.DataFrame({stock_code : prices}, index = pd.DatetimeIndex(dates, name = 'date'))
+        if close_data is None:
+            close_data = stock_data
+        else:
+            close_data = close_data.merge(stock_data, how = 'outer', left_index = True, right_index = True)
+    return close_data.dropna()
+
+def _print_result(name : str, shape : tuple, seconds : float):
+    print(f"{name:<32}{shape[0]:>8} x {shape[1]:<6}{seconds:>10.3f}s")
+
+def run(n_tickers : int, years : int, legacy_tickers : int):
+    series = synthetic_series(n_tickers, years)
+    stock_codes = [stock_code for stock_code, _, _ in series]
+    print(f"{'builder':<32}{'dates x tickers':>17}{'time':>10}")
+
+    if legacy_tickers > 0:
+        start = time.perf_counter()
+        close_data = legacy_merge(series[:legacy_tickers])
+        _print_result(f"legacy merge ({legacy_tickers} tickers)", close_data.shape, time.perf_counter() - start)
+
+    for align in ALIGNMENTS:
+        for dtype in ['float64', 'float32']:
+            start = time.perf_counter()
+            panel = build_panel(series, stock_codes, align, dtype)
+            _print_result(f"panel {align} {dtype}", panel.values.shape, time.perf_counter() - start)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'close.npy')
+        start = time.perf_counter()
+        panel = build_panel(series, stock_codes, 'ffill', 'float32', path)
+        _print_result('panel ffill float32 memmap', panel.values.shape, time.perf_counter() - start)
+        print(f"Backing file: {os.path.getsize(path) / 1024 / 1024:.1f} MB")
+        del panel
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = 'Benchmark the close-price panel builder against the per-ticker merge loop on synthetic prices')
+    parser.add_argument('--tickers', type = int, default = 1600, help = 'number of synthetic stock codes')
+    parser.add_argument('--years', type = int, default = 15, help = 'years of daily prices')
+    parser.add_argument('--legacy-tickers', type = int, default = 200,
+        help = 'stock codes given to the merge loop, which is quadratic in the number of stock codes (0 to skip it)')
+    args = parser.parse_args()
+    run(args.tickers, args.years, args.legacy_tickers)
@@ -0,0 +1,98 @@
+import argparse
+import json
+import statistics
+import time
+from datetime import datetime, timedelta
+
+import pandas as pd
+from sqlalchemy import text
+
+from utils.prices import listing_info, price_query
+from utils.utilities import get_engine
+
+COLUMNS = ['date', 'open_price', 'highest_price', 'lowest_price', 'close_price', 'volume']
+
+def legacy_query(stock_code : str, start_date, end_date):
+    """Query of the analysis modules before the price layer: no partition key, so every partition is probed
+    """
+    query = text(f"""
+        SELECT {', '.join(COLUMNS)}
+        FROM public.transaction
+        WHERE
+            stock_code = :stock_code
+            AND
+            date >= :start_date
+            AND
+            date <= :end_date
+        ORDER BY date""")
+    return query, {'stock_code' : stock_code, 'start_date' : start_date, 'end_date' : end_date}
+
+def _plan_nodes(plan : dict):
+    yield plan
+    for child in plan.get('Plans', []):
+        yield from _plan_nodes(child)
+
+def explain(engine, query, params) -> dict:
+    """Run EXPLAIN ANALYZE and summarize the plan
+
+    Returns:
+        dict: scanned partitions, scan node types, shared buffers hit and read, and execution time in ms
+    """
+    with engine.connect() as connection:
+        plan = connection.execute(text(f"EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) {query.text}"), **params).scalar()
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    root = plan[0]['Plan']
+    nodes = list(_plan_nodes(root))
+    return {
+        'partitions' : sorted({node['Relation Name'] for node in nodes if 'Relation Name' in node}),
+        'scans' : sorted({node['Node Type'] for node in nodes if 'Scan' in node['Node Type']}),
+        'buffers' : root.get('Shared Hit Blocks', 0) + root.get('Shared Read Blocks', 0),
+        'execution_ms' : plan[0]['Execution Time']
+    }
+
+def latency(engine, query, params, repeat : int) -> float:
+    """Median wall time in ms of reading the query into a DataFrame
+    """
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        pd.read_sql_query(query, engine, params = params)
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings)
+
+def run(stock_codes : list, n_codes : int, days : int, repeat : int):
+    engine = get_engine()
+    if not stock_codes:
+        stock_codes = pd.read_sql_query(text("""
+            SELECT stock_code FROM public.stock_info ORDER BY random() LIMIT :n_codes"""),
+            engine, params = {'n_codes' : n_codes})['stock_code'].tolist()
+    listings = listing_info(stock_codes, engine)
+    end_date = datetime.today().date()
+    start_date = end_date - timedelta(days = days)
+
+    print(f"{'stock code':<12}{'query':<8}{'partitions':>11}  {'scans':<40}{'buffers':>9}{'exec ms':>10}{'median ms':>11}")
+    totals = {'legacy' : [], 'pruned' : []}
+    for stock_code in stock_codes:
+        queries = {
+            'legacy' : legacy_query(stock_code, start_date, end_date),
+            'pruned' : price_query(stock_code, listings[stock_code]['partitions'], COLUMNS, start_date, end_date)
+        }
+        for name, (query, params) in queries.items():
+            plan = explain(engine, query, params)
+            median = latency(engine, query, params, repeat)
+            totals[name].append(median)
+            print(f"{stock_code:<12}{name:<8}{len(plan['partitions']):>11}  {', '.join(plan['scans']):<40}"
+                f"{plan['buffers']:>9}{plan['execution_ms']:>10.2f}{median:>11.2f}")
+    for name, timings in totals.items():
+        if len(timings) > 0:
+            print(f"{name}: median latency over {len(timings)} stock codes {statistics.median(timings):.2f} ms")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = 'Compare the plans and latencies of the legacy and the partition-pruned price queries')
+    parser.add_argument('--codes', nargs = '*', default = [], help = 'stock codes to query, random ones by default')
+    parser.add_argument('--n-codes', type = int, default = 20, help = 'number of random stock codes')
+    parser.add_argument('--days', type = int, default = 365, help = 'days of prices per query')
+    parser.add_argument('--repeat', type = int, default = 5, help = 'runs per query for the latency')
+    args = parser.parse_args()
+    run(args.codes, args.n_codes, args.days, args.repeat)
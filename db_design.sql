@@ -107,6 +107,29 @@ CREATE TABLE public.hsx_transaction (
 
 ALTER TABLE public.hsx_transaction OWNER TO thepublic;
 
+--
+-- Name: ingestion_coverage; Type: TABLE; Schema: public; Owner: thepublic
+--
+
+CREATE TABLE public.ingestion_coverage (
+    feed character varying(20) NOT NULL,
+    archive_hash character(64) NOT NULL,
+    first_date date NOT NULL,
+    last_date date NOT NULL,
+    row_count bigint NOT NULL,
+    complete boolean DEFAULT false NOT NULL,
+    updated_at timestamp without time zone DEFAULT now() NOT NULL
+);
+
+
+ALTER TABLE public.ingestion_coverage OWNER TO thepublic;
+
+--
+-- Name: TABLE ingestion_coverage; Type: COMMENT; Schema: public; Owner: thepublic
+--
+
+COMMENT ON TABLE public.ingestion_coverage IS 'date ranges loaded from each archive, per stock exchange or stock index';
+
 --
 -- Name: stock_index; Type: TABLE; Schema: public; Owner: thepublic
 --
@@ -140,6 +163,31 @@ CREATE TABLE public.stock_info (
 
 ALTER TABLE public.stock_info OWNER TO thepublic;
 
+--
+-- Name: transaction_quarantine; Type: TABLE; Schema: public; Owner: thepublic
+--
+
+CREATE TABLE public.transaction_quarantine (
+    stock_exchange public.vietnam_stock_exchange NOT NULL,
+    stock_code character varying(20) NOT NULL,
+    date date NOT NULL,
+    open_price double precision,
+    highest_price double precision,
+    lowest_price double precision,
+    close_price double precision,
+    volume bigint,
+    quarantined_at timestamp without time zone DEFAULT now() NOT NULL
+);
+
+
+ALTER TABLE public.transaction_quarantine OWNER TO thepublic;
+
+--
+-- Name: TABLE transaction_quarantine; Type: COMMENT; Schema: public; Owner: thepublic
+--
+
+COMMENT ON TABLE public.transaction_quarantine IS 'transactions whose stock code is not in stock_info yet';
+
 --
 -- Name: upcom_transaction; Type: TABLE; Schema: public; Owner: thepublic
 --
@@ -179,6 +227,14 @@ ALTER TABLE ONLY public.transaction ATTACH PARTITION public.hsx_transaction FOR
 ALTER TABLE ONLY public.transaction ATTACH PARTITION public.upcom_transaction FOR VALUES IN ('UPCOM');
 
 
+--
+-- Name: ingestion_coverage ingestion_coverage_pkey; Type: CONSTRAINT; Schema: public; Owner: thepublic
+--
+
+ALTER TABLE ONLY public.ingestion_coverage
+    ADD CONSTRAINT ingestion_coverage_pkey PRIMARY KEY (feed, archive_hash);
+
+
 --
 -- Name: transaction transaction_unique_key; Type: CONSTRAINT; Schema: public; Owner: thepublic
 --
@@ -203,6 +259,14 @@ ALTER TABLE ONLY public.hsx_transaction
     ADD CONSTRAINT hsx_transaction_stock_exchange_stock_code_date_key UNIQUE (stock_exchange, stock_code, date);
 
 
+--
+-- Name: transaction_quarantine transaction_quarantine_unique_key; Type: CONSTRAINT; Schema: public; Owner: thepublic
+--
+
+ALTER TABLE ONLY public.transaction_quarantine
+    ADD CONSTRAINT transaction_quarantine_unique_key UNIQUE (stock_exchange, stock_code, date);
+
+
 --
 -- Name: stock_index stock_index_unique_key; Type: CONSTRAINT; Schema: public; Owner: thepublic
 --
@@ -227,6 +291,48 @@ ALTER TABLE ONLY public.upcom_transaction
     ADD CONSTRAINT upcom_transaction_stock_exchange_stock_code_date_key UNIQUE (stock_exchange, stock_code, date);
 
 
+--
+-- Name: ingestion_coverage_feed_last_date_idx; Type: INDEX; Schema: public; Owner: thepublic
+--
+
+CREATE INDEX ingestion_coverage_feed_last_date_idx ON public.ingestion_coverage USING btree (feed, last_date) WHERE complete;
+
+
+--
+-- Name: transaction_quarantine_stock_code_idx; Type: INDEX; Schema: public; Owner: thepublic
+--
+
+CREATE INDEX transaction_quarantine_stock_code_idx ON public.transaction_quarantine USING btree (stock_code);
+
+
+--
+-- Name: transaction_stock_code_date_idx; Type: INDEX; Schema: public; Owner: thepublic
+--
+
+CREATE INDEX transaction_stock_code_date_idx ON ONLY public.transaction USING btree (stock_code, date) INCLUDE (open_price, highest_price, lowest_price, close_price, volume);
+
+
+--
+-- Name: hnx_transaction_stock_code_date_idx; Type: INDEX; Schema: public; Owner: thepublic
+--
+
+CREATE INDEX hnx_transaction_stock_code_date_idx ON public.hnx_transaction USING btree (stock_code, date) INCLUDE (open_price, highest_price, lowest_price, close_price, volume);
+
+
+--
+-- Name: hsx_transaction_stock_code_date_idx; Type: INDEX; Schema: public; Owner: thepublic
+--
+
+CREATE INDEX hsx_transaction_stock_code_date_idx ON public.hsx_transaction USING btree (stock_code, date) INCLUDE (open_price, highest_price, lowest_price, close_price, volume);
+
+
+--
+-- Name: upcom_transaction_stock_code_date_idx; Type: INDEX; Schema: public; Owner: thepublic
+--
+
+CREATE INDEX upcom_transaction_stock_code_date_idx ON public.upcom_transaction USING btree (stock_code, date) INCLUDE (open_price, highest_price, lowest_price, close_price, volume);
+
+
 --
 -- Name: hnx_transaction_stock_exchange_stock_code_date_key; Type: INDEX ATTACH; Schema: public; Owner: thepublic
 --
@@ -248,6 +354,27 @@ ALTER INDEX public.transaction_unique_key ATTACH PARTITION public.hsx_transactio
 ALTER INDEX public.transaction_unique_key ATTACH PARTITION public.upcom_transaction_stock_exchange_stock_code_date_key;
 
 
+--
+-- Name: hnx_transaction_stock_code_date_idx; Type: INDEX ATTACH; Schema: public; Owner: thepublic
+--
+
+ALTER INDEX public.transaction_stock_code_date_idx ATTACH PARTITION public.hnx_transaction_stock_code_date_idx;
+
+
+--
+-- Name: hsx_transaction_stock_code_date_idx; Type: INDEX ATTACH; Schema: public; Owner: thepublic
+--
+
+ALTER INDEX public.transaction_stock_code_date_idx ATTACH PARTITION public.hsx_transaction_stock_code_date_idx;
+
+
+--
+-- Name: upcom_transaction_stock_code_date_idx; Type: INDEX ATTACH; Schema: public; Owner: thepublic
+--
+
+ALTER INDEX public.transaction_stock_code_date_idx ATTACH PARTITION public.upcom_transaction_stock_code_date_idx;
+
+
 --
 -- Name: transaction stock_code_f_key; Type: FK CONSTRAINT; Schema: public; Owner: thepublic
 --
@@ -0,0 +1,145 @@
+import os
+import shutil
+import socket
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from selenium import webdriver
+
+from utils.constants import CHROME_DRIVER_PATH
+
+def free_port() -> int:
+    """Ask the OS for a port nobody listens on
+    """
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+class BrowserPool(object):
+    """A fixed number of isolated headless chrome drivers shared by the listing scrapers
+
+    Every driver gets its own debugging port and profile folder, so several pools (or scrapers) can run on one host.
+    Drivers are started lazily, the first time they are needed.
+    """
+    def __init__(self, size : int = 2, headless : bool = True):
+        if size < 1:
+            raise ValueError(f"Pool size must be at least 1, got {size}")
+        self.size = size
+        self.headless = headless
+        self._idle = []
+        self._drivers = []
+        self._profiles = []
+        # drivers started or starting, guarded by _available like _idle
+        self._started = 0
+        self._available = threading.Condition()
+
+    def _start_driver(self):
+        profile = tempfile.mkdtemp(prefix = 'chrome-profile-')
+        option = webdriver.ChromeOptions()
+        if self.headless:
+            option.add_argument('headless')
+        option.add_argument(f'--remote-debugging-port={free_port()}')
+        option.add_argument(f'--user-data-dir={profile}')
+        try:
+            driver = webdriver.Chrome(
+                os.path.join(CHROME_DRIVER_PATH, "chromedriver_linux64", "chromedriver"),
+                options = option
+            )
+        except Exception:
+            shutil.rmtree(profile, ignore_errors = True)
+            raise
+        with self._available:
+            self._drivers.append(driver)
+            self._profiles.append(profile)
+        return driver
+
+    @contextmanager
+    def driver(self):
+        """Borrow a driver, starting a new one while the pool is not full
+        """
+        with self._available:
+            # borrowing an idle driver and reserving a new one are decided under one lock
+            while len(self._idle) == 0 and self._started >= self.size:
+                self._available.wait()
+            driver = self._idle.pop() if len(self._idle) > 0 else None
+            if driver is None:
+                self._started += 1
+        if driver is None:
+            # chrome starts outside the lock, so several drivers start at once
+            try:
+                driver = self._start_driver()
+            except Exception:
+                with self._available:
+                    self._started -= 1
+                    self._available.notify()
+                raise
+        try:
+            yield driver
+        finally:
+            with self._available:
+                self._idle.append(driver)
+                self._available.notify()
+
+    def map_pages(self, pages : list, scrape_pages) -> list:
+        """Split pages in contiguous ranges, one per driver, and scrape the ranges in parallel
+
+        Args:
+            pages (list): page numbers, in order
+            scrape_pages (callable): scrape_pages(driver, pages) -> list of results, one per page
+
+        Returns:
+            list: results of every page, in the order of pages
+        """
+        pages = list(pages)
+        n_ranges = min(self.size, len(pages))
+        if n_ranges == 0:
+            return []
+        bounds = [len(pages) * i // n_ranges for i in range(n_ranges + 1)]
+        ranges = [pages[bounds[i]:bounds[i + 1]] for i in range(n_ranges)]
+
+        def scrape(page_range):
+            with self.driver() as driver:
+                return scrape_pages(driver, page_range)
+
+        with ThreadPoolExecutor(max_workers = n_ranges) as executor:
+            results = list(executor.map(scrape, ranges))
+        return [result for range_results in results for result in range_results]
+
+    def close(self):
+        for driver in self._drivers:
+            driver.quit()
+        for profile in self._profiles:
+            shutil.rmtree(profile, ignore_errors = True)
+        with self._available:
+            self._drivers = []
+            self._profiles = []
+            self._idle = []
+            self._started = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+# serialize the cell texts of a table in the browser, one WebDriver round trip per page
+TABLE_ROWS_SCRIPT = """
+return Array.from(document.querySelectorAll(arguments[0])).map(
+    row => Array.from(row.querySelectorAll(arguments[1])).map(cell => cell.textContent.trim())
+);
+"""
+
+def table_rows(driver, row_selector : str, cell_selector : str = 'td') -> list:
+    """Read the cell texts of the rows matching row_selector with a single execute_script
+
+    Args:
+        driver: selenium driver
+        row_selector (str): css selector of the rows
+        cell_selector (str, optional): css selector of the cells inside a row. Defaults to 'td'.
+
+    Returns:
+        list: list of cell texts per row
+    """
+    return driver.execute_script(TABLE_ROWS_SCRIPT, row_selector, cell_selector)
@@ -0,0 +1,94 @@
+import argparse
+
+from utils.utilities import get_engine, print_pool_stats
+from utils.dag import Dag
+from utils.download_cache import DownloadCache
+from tasks.browser_pool import BrowserPool
+from tasks.daily_transaction import DailyTransaction
+from tasks.hnx_stock_codes import HNXStocks
+from tasks.hsx_stock_codes import HNXStocks as HSXStocks
+from tasks.upcom_stock_codes import UPCOMStocks
+
+class DailyPipeline(object):
+    """The daily update as one process: listing syncs, then transaction and index loading
+
+    The three listing syncs run concurrently. The index feed only waits for the archive probe, the transaction feed
+    also waits for the listings so that new stock codes are known. A failed listing does not stop the transaction
+    feed: the rows of stock codes it would have added go to the quarantine. One engine, one browser pool and one
+    download cache are shared by every task.
+    """
+    def __init__(self, backend = 'http', browsers = 2, load_mode = 'bulk', workers = 1, cache_size = 1024 * 1024 * 1024,
+            update_mode = 'incremental', max_gap_days = 30):
+        # three listing syncs, the index feed and the transaction workers may hold a connection at the same time
+        self.engine = get_engine(pool_size = max(5, workers + 4))
+        # drivers are only started if a listing falls back to selenium
+        self.browser_pool = BrowserPool(size = browsers)
+        self.cache = DownloadCache(DailyTransaction.ROOT_PATH, max_size = cache_size)
+        self.listings = {
+            'hnx_stock_codes' : HNXStocks(backend = backend, browser_pool = self.browser_pool, engine = self.engine),
+            'hsx_stock_codes' : HSXStocks(backend = backend, browser_pool = self.browser_pool, engine = self.engine),
+            'upcom_stock_codes' : UPCOMStocks(backend = backend, browser_pool = self.browser_pool, engine = self.engine)
+        }
+        self.daily_transaction = DailyTransaction(
+            load_mode = load_mode,
+            workers = workers,
+            update_mode = update_mode,
+            max_gap_days = max_gap_days,
+            engine = self.engine,
+            cache = self.cache
+        )
+        self.dag = Dag()
+
+    def _build_dag(self):
+        dag = Dag()
+        dag.add('probe_archives', self.daily_transaction._probe_latest)
+        for name, listing in self.listings.items():
+            dag.add(name, listing.work)
+        dag.add('stock_index', lambda latest: self.daily_transaction.update_indexes(latest[1]), ['probe_archives'])
+        dag.add('transaction', lambda latest: self.daily_transaction.update_transactions(latest[0]),
+            ['probe_archives'], after = list(self.listings))
+        return dag
+
+    def work(self):
+        self.dag = self._build_dag()
+        try:
+            self.dag.run()
+        finally:
+            self.browser_pool.close()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = 'Update the listings, the transactions and the indexes in one run')
+    parser.add_argument('--backend', choices = ['http', 'selenium'], default = 'http',
+        help = 'backend of the listing scrapers, http falls back to selenium when the endpoints fail')
+    parser.add_argument('--browsers', type = int, default = 2,
+        help = 'size of the browser pool shared by the listing scrapers')
+    parser.add_argument('--load-mode', choices = DailyTransaction.LOAD_MODES, default = 'bulk',
+        help = 'row: one INSERT per row, bulk: COPY to a staging table and merge once per exchange')
+    parser.add_argument('--workers', type = int, default = 1,
+        help = 'number of exchange files loaded concurrently, each on its own pooled connection')
+    parser.add_argument('--cache-size', type = int, default = 1024,
+        help = 'maximum size of the download cache in MB')
+    parser.add_argument('--update-mode', choices = DailyTransaction.UPDATE_MODES, default = 'incremental',
+        help = 'upto: always load the full history archive, incremental: load the eod archives of the missing days')
+    parser.add_argument('--max-gap-days', type = int, default = 30,
+        help = 'in incremental mode, fall back to the full history archive for gaps longer than this')
+    parser.add_argument('--report', help = 'path of the JSON run report of the transaction and index loading')
+    args = parser.parse_args()
+    pipeline = DailyPipeline(
+        backend = args.backend,
+        browsers = args.browsers,
+        load_mode = args.load_mode,
+        workers = args.workers,
+        cache_size = args.cache_size * 1024 * 1024,
+        update_mode = args.update_mode,
+        max_gap_days = args.max_gap_days
+    )
+    try:
+        pipeline.work()
+    finally:
+        pipeline.daily_transaction.report.print_summary()
+        pipeline.dag.print_report()
+        # connections used at the end of the run, to size the pool for the workers
+        print_pool_stats()
+        if args.report is not None:
+            pipeline.daily_transaction.report.write_json(args.report)
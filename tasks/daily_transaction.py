@@ -1,59 +1,458 @@
 from datetime import datetime, timedelta
-import urllib.request
-import os
-import zipfile
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
 import pandas as pd
-import shutil
 from sqlalchemy import text
 from sqlalchemy import exc
-from utils.utilities import get_engine
-from urllib.error import HTTPError, URLError
+from utils.utilities import get_engine, copy_dataframe, anti_join, coalesce_date_ranges, in_ranges
+from utils.cafef import open_archive, read_cafef_csv, iter_in_background
+from utils.download_cache import DownloadCache, content_digest, is_published
+from utils.async_download import AsyncDownloader
+from utils.quarantine import replay_quarantine
+from utils.instrumentation import RunReport, ProgressLogger
 
 
 class DailyTransaction(object):
-    EOD_TRANSACTION_FORMAT_URL = 'https://cafef1.mediacdn.vn/data/ami_data/{}/CafeF.SolieuGD.{}.zip'
-    UP_TO_TRANSACTION_FORMAT_URL = 'https://cafef1.mediacdn.vn/data/ami_data/{}/CafeF.SolieuGD.Upto{}.zip'
+    BASE_URL = 'https://cafef1.mediacdn.vn/data/ami_data'
+    EOD_TRANSACTION_FORMAT_URL = '{}/{}/CafeF.SolieuGD.{}.zip'
+    UP_TO_TRANSACTION_FORMAT_URL = '{}/{}/CafeF.SolieuGD.Upto{}.zip'
     EOD_FILE_FORMAT = 'CafeF.{}.{}.{}.{}.csv'
     UPTO_FILE_FORMAT = 'CafeF.{}.Upto{}.{}.{}.csv'
-    EOD_INDEX_FORMAT_URL = 'https://cafef1.mediacdn.vn/data/ami_data/{}/CafeF.Index.{}.zip'
-    UPTO_INDEX_FORMAT_URL = 'https://cafef1.mediacdn.vn/data/ami_data/{}/CafeF.Index.Upto{}.zip'
+    EOD_INDEX_FORMAT_URL = '{}/{}/CafeF.Index.{}.zip'
+    UPTO_INDEX_FORMAT_URL = '{}/{}/CafeF.Index.Upto{}.zip'
     EOD_INDEX_FILE_FORMAT_URL = 'CafeF.INDEX.{}.{}.{}.csv'
     UPTO_INDEX_FILE_FORMAT_URL = 'CafeF.INDEX.Upto{}.{}.{}.csv'
     ROOT_PATH = '.cache'
-    def __init__(self):
-        self.engine = get_engine()
+    PROBE_WINDOW = 7
+    MAX_PROBE_DAYS = 60
+    LOAD_MODES = ['row', 'bulk']
+    UPDATE_MODES = ['upto', 'incremental']
+    TRANSACTION_COLUMNS = ['stock_exchange', 'stock_code', 'date', 'open_price', 'highest_price', 'lowest_price', 'close_price', 'volume']
+    INDEX_COLUMNS = ['stock_index', 'date', 'open_price', 'highest_price', 'lowest_price', 'close_price', 'volume']
+    STOCK_EXCHANGES = ['HNX', 'HSX', 'UPCOM']
+    STOCK_INDEXES = ['VNINDEX', 'HNX-INDEX']
+    def __init__(self, load_mode = 'bulk', workers = 1, cache_size = 1024 * 1024 * 1024, update_mode = 'incremental', max_gap_days = 30, base_url = BASE_URL, engine = None, cache = None):
+        if load_mode not in DailyTransaction.LOAD_MODES:
+            raise ValueError(f"Unknown load mode {load_mode}. Expected one of {DailyTransaction.LOAD_MODES}")
+        if update_mode not in DailyTransaction.UPDATE_MODES:
+            raise ValueError(f"Unknown update mode {update_mode}. Expected one of {DailyTransaction.UPDATE_MODES}")
+        if workers < 1:
+            raise ValueError(f"Number of workers must be at least 1, got {workers}")
+        # each worker holds its own pooled connection, plus one for the index feed
+        self.engine = engine if engine is not None else get_engine(pool_size = max(5, workers + 1))
+        # another base url (e.g. a local server in the benchmarks) can serve the CafeF archives
+        self.base_url = base_url.rstrip('/')
         self.schema = 'public'
         self.table = 'transaction'
         self.index_table = 'stock_index'
+        self.coverage_table = 'ingestion_coverage'
+        self.quarantine_table = 'transaction_quarantine'
+        self.load_mode = load_mode
+        self.workers = workers
+        self.cache = cache if cache is not None else DownloadCache(DailyTransaction.ROOT_PATH, max_size = cache_size)
+        self.update_mode = update_mode
+        self.max_gap_days = max_gap_days
+        self.downloader = AsyncDownloader(cache = self.cache)
+        self._stock_codes = None
+        self._stock_codes_lock = threading.Lock()
+        self.report = RunReport()
 
-    def _crawl_index(self, date, mode = 'eod'):
-        today_format_1 = date.strftime('%Y%m%d')
-        today_format_2 = date.strftime('%d%m%Y')
-        save_path = os.path.join('.cache', f'{today_format_1}.zip')
+    def _known_stock_codes(self):
+        """Stock codes of stock_info, read once per run
+        """
+        with self._stock_codes_lock:
+            if self._stock_codes is None:
+                query = f"""SELECT stock_code FROM {self.schema}.stock_info"""
+                self._stock_codes = pd.read_sql_query(query, self.engine)['stock_code']
+            return self._stock_codes
+
+    def _quarantine(self, connection, df, stock_exchange):
+        """Keep rows with an unknown stock code aside until the listing scrapers add the code
+
+        Args:
+            connection: connection of the load transaction
+            df (pd.DataFrame): rows with an unknown stock code
+            stock_exchange (str): stock exchange of the rows
+        """
+        if len(df) == 0:
+            return
+        staging_table = f'{stock_exchange.lower()}_quarantine_staging'
+        connection.execute(text(f"""
+            CREATE TEMP TABLE {staging_table}
+            (LIKE {self.schema}.{self.table}) ON COMMIT DROP"""))
+        copy_dataframe(connection, df.assign(stock_exchange = stock_exchange), staging_table, DailyTransaction.TRANSACTION_COLUMNS)
+        connection.execute(text(f"""
+            INSERT INTO {self.schema}.{self.quarantine_table} ({', '.join(DailyTransaction.TRANSACTION_COLUMNS)})
+            SELECT s.* FROM {staging_table} s
+            ON CONFLICT ON CONSTRAINT transaction_quarantine_unique_key DO NOTHING"""))
+
+    def _chunk_coverage(self, df, feed_column, date, digest):
+        """Summarize the rows of a chunk read from an archive, per feed
+
+        Args:
+            df (pd.DataFrame): chunk read from the archive
+            feed_column (str): stock_exchange or stock_index
+            date (datetime.date): last date to load
+            digest (str): hash of the archive
+
+        Returns:
+            pd.DataFrame: feed, archive_hash, first_date, last_date and row_count
+        """
+        df = df[df['date'] <= pd.Timestamp(date)]
+        coverage = df.groupby(df[feed_column].astype(str))['date'].agg(['min', 'max', 'count']).reset_index()
+        coverage.columns = ['feed', 'first_date', 'last_date', 'row_count']
+        coverage['archive_hash'] = digest
+        return coverage
+
+    def _record_coverage(self, connection, coverage):
+        """Extend the coverage of an archive, in the transaction of the load
+        """
+        for _, row in coverage.iterrows():
+            connection.execute(text(f"""
+                INSERT INTO {self.schema}.{self.coverage_table} (feed, archive_hash, first_date, last_date, row_count)
+                VALUES (:feed, :archive_hash, :first_date, :last_date, :row_count)
+                ON CONFLICT ON CONSTRAINT ingestion_coverage_pkey
+                DO UPDATE SET
+                    first_date = LEAST({self.coverage_table}.first_date, EXCLUDED.first_date),
+                    last_date = GREATEST({self.coverage_table}.last_date, EXCLUDED.last_date),
+                    row_count = {self.coverage_table}.row_count + EXCLUDED.row_count,
+                    updated_at = now()"""),
+                feed = row['feed'],
+                archive_hash = row['archive_hash'],
+                first_date = row['first_date'].date(),
+                last_date = row['last_date'].date(),
+                row_count = int(row['row_count'])
+            )
+
+    def _start_coverage(self, feeds, digest):
+        """Forget the coverage left by an interrupted load of an archive, so that a re-run counts every chunk once
+
+        Returns:
+            list: feeds whose load of the archive already completed
+        """
+        with self.engine.begin() as connection:
+            connection.execute(text(f"""
+                DELETE FROM {self.schema}.{self.coverage_table}
+                WHERE archive_hash = :archive_hash AND feed = ANY(:feeds) AND NOT complete"""),
+                archive_hash = digest,
+                feeds = list(feeds)
+            )
+            completed = connection.execute(text(f"""
+                SELECT feed FROM {self.schema}.{self.coverage_table}
+                WHERE archive_hash = :archive_hash AND feed = ANY(:feeds) AND complete"""),
+                archive_hash = digest,
+                feeds = list(feeds)
+            ).fetchall()
+        return [row[0] for row in completed]
+
+    def _complete_coverage(self, feeds, digest):
+        """Mark the coverage of an archive as complete once all of its chunks are loaded
+        """
+        with self.engine.begin() as connection:
+            connection.execute(text(f"""
+                UPDATE {self.schema}.{self.coverage_table}
+                SET complete = true, updated_at = now()
+                WHERE archive_hash = :archive_hash AND feed = ANY(:feeds)"""),
+                archive_hash = digest,
+                feeds = list(feeds)
+            )
+
+    def _covered_ranges(self, feeds):
+        """Read the date ranges fully loaded for feeds
+
+        Returns:
+            pd.DataFrame: feed, first_date and last_date of the complete loads, merged into disjoint ranges
+        """
+        query = text(f"""SELECT feed, first_date, last_date
+            FROM {self.schema}.{self.coverage_table}
+            WHERE complete AND feed = ANY(:feeds)
+        """)
+        ranges = pd.read_sql_query(query, self.engine, params = {'feeds' : list(feeds)})
+        ranges['first_date'] = pd.to_datetime(ranges['first_date'])
+        ranges['last_date'] = pd.to_datetime(ranges['last_date'])
+        return coalesce_date_ranges(ranges, 'feed')
+
+    def _insert_index_rows(self, df):
+        """Insert index rows one statement at a time
+
+        Args:
+            df (pd.DataFrame): index rows to insert
+
+        Returns:
+            int: number of processed rows
+        """
+        progress = ProgressLogger('Index', len(df))
+        for _, row in df.iterrows():
+            query = text(f""" 
+                INSERT INTO {self.schema}.{self.index_table}
+                VALUES ( 
+                    '{row["stock_index"].upper()}', 
+                    '{row["date"].strftime('%Y-%m-%d')}',
+                    {row["open_price"]},
+                    {row["highest_price"]},
+                    {row["lowest_price"]},
+                    {row["close_price"]},
+                    {row["volume"]}
+                )
+                ON CONFLICT ON CONSTRAINT stock_index_unique_key DO NOTHING;""")
+            self.engine.execute(query)
+            progress.update()
+        return len(df)
+
+    def _copy_index_rows(self, df, coverage):
+        """COPY index rows into a staging table and merge them with one INSERT ... SELECT
+
+        Args:
+            df (pd.DataFrame): index rows to insert
+            coverage (pd.DataFrame): coverage recorded in the same transaction
+
+        Returns:
+            int: number of inserted rows
+        """
+        with self.engine.begin() as connection:
+            connection.execute(text(f"""
+                CREATE TEMP TABLE stock_index_staging (
+                    stock_index character varying,
+                    date date,
+                    open_price double precision,
+                    highest_price double precision,
+                    lowest_price double precision,
+                    close_price double precision,
+                    volume bigint
+                ) ON COMMIT DROP"""))
+            copy_dataframe(connection, df, 'stock_index_staging', DailyTransaction.INDEX_COLUMNS)
+            result = connection.execute(text(f"""
+                INSERT INTO {self.schema}.{self.index_table}
+                SELECT
+                    upper(s.stock_index)::{self.schema}.vietnam_stock_index,
+                    s.date,
+                    s.open_price,
+                    s.highest_price,
+                    s.lowest_price,
+                    s.close_price,
+                    s.volume
+                FROM stock_index_staging s
+                ON CONFLICT ON CONSTRAINT stock_index_unique_key DO NOTHING"""))
+            self._record_coverage(connection, coverage)
+            return result.rowcount
+
+    def _insert_transaction_rows(self, df, stock_exchange):
+        """Insert transaction rows one statement at a time
+
+        Args:
+            df (pd.DataFrame): transaction rows to insert
+            stock_exchange (str): stock exchange of the rows
 
+        Returns:
+            int: number of inserted rows
+        """
+        progress = ProgressLogger(stock_exchange, len(df))
+        inserted = 0
+        for _, row in df.iterrows():
+            query = text(f""" 
+                INSERT INTO {self.schema}.{self.table}
+                VALUES (
+                    '{stock_exchange}', 
+                    '{row["stock_code"]}', 
+                    '{row["date"].strftime('%Y-%m-%d')}',
+                    {row["open_price"]},
+                    {row["highest_price"]},
+                    {row["lowest_price"]},
+                    {row["close_price"]},
+                    {row["volume"]}
+                )
+                ON CONFLICT ON CONSTRAINT transaction_unique_key DO NOTHING;""")
+            try:
+                self.engine.execute(query)
+            except exc.IntegrityError:
+                self.report.count(stock_exchange, 'rows_rejected')
+                continue
+            inserted += 1
+            progress.update()
+        return inserted
+
+    def _copy_transaction_rows(self, df, stock_exchange, coverage, quarantined):
+        """COPY transaction rows into a staging table and merge them with one INSERT ... SELECT
+
+        Args:
+            df (pd.DataFrame): transaction rows to insert, with known stock codes only
+            stock_exchange (str): stock exchange of the rows
+            coverage (pd.DataFrame): coverage recorded in the same transaction
+            quarantined (pd.DataFrame): rows with unknown stock codes, quarantined in the same transaction
+
+        Returns:
+            int: number of inserted rows
+        """
+        staging_table = f'{stock_exchange.lower()}_transaction_staging'
+        with self.engine.begin() as connection:
+            connection.execute(text(f"""
+                CREATE TEMP TABLE {staging_table}
+                (LIKE {self.schema}.{self.table}) ON COMMIT DROP"""))
+            copy_dataframe(connection, df.assign(stock_exchange = stock_exchange), staging_table, DailyTransaction.TRANSACTION_COLUMNS)
+            result = connection.execute(text(f"""
+                INSERT INTO {self.schema}.{self.table}
+                SELECT s.*
+                FROM {staging_table} s
+                ON CONFLICT ON CONSTRAINT transaction_unique_key DO NOTHING"""))
+            self._quarantine(connection, quarantined, stock_exchange)
+            self._record_coverage(connection, coverage)
+            return result.rowcount
+
+    def _load_index(self, df, coverage):
+        """Load index rows with the configured load mode and count the outcome
+
+        Args:
+            df (pd.DataFrame): index rows to insert
+            coverage (pd.DataFrame): coverage of the chunk the rows come from
+        """
+        with self.report.stage('load', 'index'):
+            if len(df) == 0:
+                with self.engine.begin() as connection:
+                    self._record_coverage(connection, coverage)
+                return
+            if self.load_mode == 'bulk':
+                inserted = self._copy_index_rows(df, coverage)
+            else:
+                inserted = self._insert_index_rows(df)
+                with self.engine.begin() as connection:
+                    self._record_coverage(connection, coverage)
+        self.report.count('index', 'rows_loaded', len(df))
+        self.report.count('index', 'rows_inserted', inserted)
+        self.report.count('index', 'rows_conflicting', len(df) - inserted)
+
+    def _load_transaction(self, df, stock_exchange, coverage):
+        """Load transaction rows with the configured load mode and count the outcome
+
+        Rows whose stock code is not in stock_info would violate stock_code_f_key, so they are split off
+        and written to the quarantine table instead.
+
+        Args:
+            df (pd.DataFrame): transaction rows to insert
+            stock_exchange (str): stock exchange of the rows
+            coverage (pd.DataFrame): coverage of the chunk the rows come from
+        """
+        with self.report.stage('load', stock_exchange):
+            known = df['stock_code'].isin(self._known_stock_codes())
+            quarantined = df[~known]
+            df = df[known]
+            if self.load_mode == 'bulk' and len(df) > 0:
+                inserted = self._copy_transaction_rows(df, stock_exchange, coverage, quarantined)
+            else:
+                inserted = self._insert_transaction_rows(df, stock_exchange) if len(df) > 0 else 0
+                with self.engine.begin() as connection:
+                    self._quarantine(connection, quarantined, stock_exchange)
+                    self._record_coverage(connection, coverage)
+        self.report.count(stock_exchange, 'rows_loaded', len(df))
+        self.report.count(stock_exchange, 'rows_inserted', inserted)
+        self.report.count(stock_exchange, 'rows_conflicting', len(df) - inserted)
+        self.report.count(stock_exchange, 'rows_quarantined', len(quarantined))
+
+    def _existing_keys(self, table, key_column, date, stock_exchange = None, since = None):
+        """Read the (ticker, date) keys that are already stored
+
+        Args:
+            table (str): table to read
+            key_column (str): ticker column, stock_code or stock_index
+            date (datetime.date): last date to load
+            stock_exchange (str, optional): restrict the keys to one partition. Defaults to None.
+            since (datetime.date, optional): first date covered by the file. Defaults to None.
+
+        Returns:
+            pd.DataFrame: key_column and date of the stored rows
+        """
+        query = f"""SELECT {key_column}, date
+            FROM {self.schema}.{table}
+            WHERE
+                date <= DATE '{date}'
+        """
+        if since is not None:
+            query += f" AND date >= DATE '{since}'"
+        if stock_exchange is not None:
+            query += f" AND stock_exchange = '{stock_exchange}'"
+        exists = pd.read_sql_query(query, self.engine)
+        exists[key_column] = exists[key_column].astype(str)
+        exists['date'] = pd.to_datetime(exists['date'])
+        return exists
+
+    def _missing_rows(self, df, key_column, feed_column, date, ranges, exists = None, feed = 'all'):
+        """Find the rows of a CafeF chunk that are not in the database yet
+
+        Rows inside a date range already covered for their feed are dropped. When a feed has no coverage yet
+        (a database filled before the coverage table existed), the remaining rows are anti-joined with exists.
+
+        Args:
+            df (pd.DataFrame): parsed CafeF rows with key_column, feed_column and date
+            key_column (str): ticker column, stock_code or stock_index
+            feed_column (str): stock_exchange or stock_index
+            date (datetime.date): last date to load
+            ranges (pd.DataFrame): ranges returned by _covered_ranges
+            exists (pd.DataFrame, optional): keys returned by _existing_keys. Defaults to None.
+            feed (str, optional): name of the feed in the run report. Defaults to 'all'.
+
+        Returns:
+            pd.DataFrame: rows whose (key_column, date) is missing from the table
+        """
+        with self.report.stage('diff', feed):
+            missing = self._diff_rows(df, key_column, feed_column, date, ranges, exists)
+        self.report.count(feed, 'rows_read', len(df))
+        self.report.count(feed, 'rows_skipped', len(df) - len(missing))
+        return missing
+
+    def _diff_rows(self, df, key_column, feed_column, date, ranges, exists):
+        df = df[df['date'] <= pd.Timestamp(date)]
+        if len(df) == 0:
+            return df
+        df = df.assign(**{key_column : df[key_column].astype(str), feed_column : df[feed_column].astype(str)})
+        covered = np.zeros(len(df), dtype = bool)
+        dates = df['date'].to_numpy()
+        for feed, feed_ranges in ranges.groupby('feed'):
+            rows = (df[feed_column] == feed).to_numpy()
+            covered[rows] = in_ranges(dates[rows], feed_ranges['first_date'].to_numpy(), feed_ranges['last_date'].to_numpy())
+        df = df[~covered]
+        if exists is None or len(df) == 0:
+            return df
+        return anti_join(df, exists, [key_column, 'date'])
+
+    def _archive_url(self, url_format, date):
+        return url_format.format(self.base_url, date.strftime('%Y%m%d'), date.strftime('%d%m%Y'))
+
+    def _download(self, url, date, feed):
+        """Download an archive through the cache and open it in memory
+
+        Returns:
+            tuple: (zipfile.ZipFile, content hash), None if the file is not published
+        """
+        with self.report.stage('download', feed):
+            result = self.cache.fetch(url)
+        if result is None:
+            print(f"Probably due to non-existed data or data from day {date} has not been updated yet. Skipping the date")
+            return None
+        content, digest = result
+        return self._open_archive(content, feed), digest
+
+    def _open_archive(self, content, feed):
+        """Open an archive in memory. Decompression itself happens while parsing
+        """
+        with self.report.stage('unzip', feed):
+            archive = open_archive(content)
+        self.report.count(feed, 'archives')
+        return archive
+
+    def _crawl_index(self, date, mode = 'eod', downloaded = None):
         # download file as zip
         if mode == 'eod':
-            transaction_url = DailyTransaction.EOD_INDEX_FORMAT_URL.format(today_format_1, today_format_2)
+            transaction_url = self._archive_url(DailyTransaction.EOD_INDEX_FORMAT_URL, date)
         else:
-            transaction_url = DailyTransaction.UPTO_INDEX_FORMAT_URL.format(today_format_1, today_format_2)
-        
-        try:
-            with urllib.request.urlopen(transaction_url) as dl_file:
-                with open(save_path, 'wb') as f:
-                    f.write(dl_file.read())
-        except HTTPError as err:
-            if err.code == 404:
-                print(f"Probably due to non-existed data or data from day {date} has not been updated yet. Skipping the date")
-                return False
-            else:
-                raise URLError(f"Encountered HTTP error: {err.code}")
-            
-        #extract file to folder
-        zip_folder = os.path.join('.cache', today_format_1)
-        with zipfile.ZipFile(save_path, 'r') as zip_ref:
-            zip_ref.extractall(zip_folder)
+            transaction_url = self._archive_url(DailyTransaction.UPTO_INDEX_FORMAT_URL, date)
+        if downloaded is None:
+            downloaded = self._download(transaction_url, date, 'index')
+        if downloaded is None:
+            return False
+        archive, digest = downloaded
 
-        # for each stock exchanges, read and save to postgresql database
+        # read the csv from the archive and save to postgresql database
         if mode == 'eod':
             print(f"Updating data for date {date}")
         else:
@@ -65,235 +464,268 @@ class DailyTransaction(object):
             file_path = DailyTransaction.EOD_INDEX_FILE_FORMAT_URL.format(day, month, year)
         else:
             file_path = DailyTransaction.UPTO_INDEX_FILE_FORMAT_URL.format(day, month, year)
-        file_path = os.path.join(zip_folder, file_path)
-        df = pd.read_csv(file_path)
-        #rename columns
-        df = df.rename(columns = {
-            '<Ticker>' : 'stock_index',
-            '<DTYYYYMMDD>' : 'date',
-            '<Open>' : 'open_price',
-            '<High>' : 'highest_price',
-            '<Low>' : 'lowest_price',
-            '<Close>' : 'close_price',
-            '<Volume>' : 'volume'
-        })
-        df['date'] = df['date'].apply(str)
-        df['date'] = pd.to_datetime(df['date'])
-
-        query = f"""SELECT DISTINCT(date) AS date 
-            FROM {self.schema}.{self.index_table} 
-            WHERE 
-                date <= DATE '{date}'
-        """
-        exists = pd.read_sql_query(query, self.engine)
-        if len(exists) > 0:
-            exist_dates = exists['date'].sort_values()
-            begin_date = None
-            print("Updating missing data")
-            for e in exist_dates:
-                if begin_date is None:
-                    begin_date = e
-                else:
-                    for _ in range(1,(e - begin_date).days):
-                        begin_date = begin_date + timedelta(days = 1)
-                        print(f"Update missing index on date {begin_date}")
-                        update_df = df[df['date'] == begin_date.strftime('%Y-%m-%d')]
-                        # perform update on row
-                        for index, row in update_df.iterrows():
-                            query = text(f""" 
-                                INSERT INTO {self.schema}.{self.index_table}
-                                VALUES ( 
-                                    '{row["stock_index"].upper()}', 
-                                    '{row["date"].strftime('%Y-%m-%d')}',
-                                    {row["open_price"]},
-                                    {row["highest_price"]},
-                                    {row["lowest_price"]},
-                                    {row["close_price"]},
-                                    {row["volume"]}
-                                )
-                                ON CONFLICT ON CONSTRAINT stock_index_unique_key DO NOTHING;""")
-                            self.engine.execute(query)
-                            print(f"Index: {index + 1} rows updated")
-                    begin_date = begin_date + timedelta(days = 1)
-        else:
-            begin_date = min(df['date']).date()
-        while begin_date <= date:
-            print(f"Update new index on date {begin_date}")
-            update_df = df[df['date'] == begin_date.strftime('%Y-%m-%d')]
-            # perform update on row
-            for index, row in update_df.iterrows():
-                query = text(f""" 
-                    INSERT INTO {self.schema}.{self.index_table}
-                    VALUES ( 
-                        '{row["stock_index"].upper()}', 
-                        '{row["date"].strftime('%Y-%m-%d')}',
-                        {row["open_price"]},
-                        {row["highest_price"]},
-                        {row["lowest_price"]},
-                        {row["close_price"]},
-                        {row["volume"]}
-                    )
-                    ON CONFLICT ON CONSTRAINT stock_index_unique_key DO NOTHING;""")
-                self.engine.execute(query)
-                print(f"Index: {index + 1} rows updated")
-            begin_date = begin_date + timedelta(days = 1)
-        return True
 
-    def _crawl(self, date, mode = 'eod'):
-        today_format_1 = date.strftime('%Y%m%d')
-        today_format_2 = date.strftime('%d%m%Y')
-        save_path = os.path.join('.cache', f'{today_format_1}.zip')
+        with archive:
+            # the indexes are completed together, so any completed index means the whole file was loaded
+            if len(self._start_coverage(DailyTransaction.STOCK_INDEXES, digest)) > 0:
+                print(f"{file_path} has already been loaded. Skipping the file")
+                self.report.count('index', 'archives_skipped')
+                return True
+            ranges = self._covered_ranges(DailyTransaction.STOCK_INDEXES)
+            exists = None
+            if len(ranges) == 0:
+                # an eod archive only holds its own day
+                exists = self._existing_keys(self.index_table, 'stock_index', date, since = date if mode == 'eod' else None)
+            chunks = self.report.timed_iter('parse', 'index', read_cafef_csv(archive, file_path, 'stock_index'))
+            for df in iter_in_background(chunks):
+                df['stock_index'] = df['stock_index'].str.upper()
+                # names outside STOCK_INDEXES have no enum value, drop them before the coverage and whatever the load mode
+                known = df['stock_index'].isin(DailyTransaction.STOCK_INDEXES)
+                self.report.count('index', 'rows_rejected', int((~known).sum()))
+                df = df[known]
+                missing = self._missing_rows(df, 'stock_index', 'stock_index', date, ranges, exists, feed = 'index')
+                self._load_index(missing, self._chunk_coverage(df, 'stock_index', date, digest))
+        self._complete_coverage(DailyTransaction.STOCK_INDEXES, digest)
+        return True
 
+    def _crawl(self, date, mode = 'eod', downloaded = None):
         # download file as zip
         if mode == 'eod':
-            transaction_url = DailyTransaction.EOD_TRANSACTION_FORMAT_URL.format(today_format_1, today_format_2)
+            transaction_url = self._archive_url(DailyTransaction.EOD_TRANSACTION_FORMAT_URL, date)
         else:
-            transaction_url = DailyTransaction.UP_TO_TRANSACTION_FORMAT_URL.format(today_format_1, today_format_2)
-        
-        try:
-            with urllib.request.urlopen(transaction_url) as dl_file:
-                with open(save_path, 'wb') as f:
-                    f.write(dl_file.read())
-        except HTTPError as err:
-            if err.code == 404:
-                print(f"Probably due to non-existed data or data from day {date} has not been updated yet. Skipping the date")
-                return False
-            else:
-                raise URLError(f"Encountered HTTP error: {err.code}")
-            
-        #extract file to folder
-        zip_folder = os.path.join('.cache', today_format_1)
-        with zipfile.ZipFile(save_path, 'r') as zip_ref:
-            zip_ref.extractall(zip_folder)
+            transaction_url = self._archive_url(DailyTransaction.UP_TO_TRANSACTION_FORMAT_URL, date)
+        if downloaded is None:
+            downloaded = self._download(transaction_url, date, 'transaction')
+        if downloaded is None:
+            return False
+        archive, digest = downloaded
 
         # for each stock exchanges, read and save to postgresql database
         if mode == 'eod':
             print(f"Updating data for date {date}")
         else:
             print(f"Updating data for date {date} and previous days")
-        stock_exchanges = ['HNX', 'HSX', 'UPCOM']
-        for stock_exchange in stock_exchanges:
-            day = str(date.day).zfill(2)
-            month = str(date.month).zfill(2)
-            year = date.year
-            if mode == 'eod':
-                file_path = DailyTransaction.EOD_FILE_FORMAT.format(stock_exchange, day, month, year)
-            else:
-                file_path = DailyTransaction.UPTO_FILE_FORMAT.format(stock_exchange, day, month, year)
-            file_path = os.path.join(zip_folder, file_path)
-            df = pd.read_csv(file_path)
-            #rename columns
-            df = df.rename(columns = {
-                '<Ticker>' : 'stock_code',
-                '<DTYYYYMMDD>' : 'date',
-                '<Open>' : 'open_price',
-                '<High>' : 'highest_price',
-                '<Low>' : 'lowest_price',
-                '<Close>' : 'close_price',
-                '<Volume>' : 'volume'
-            })
-            df['stock_exchange'] = stock_exchange
-            df['date'] = df['date'].apply(str)
-            df['date'] = pd.to_datetime(df['date'])
-
-            query = f"""SELECT DISTINCT(date) AS date 
-                FROM {self.schema}.{self.table} 
-                WHERE 
-                    date <= DATE '{date}'
-                    AND
-                    stock_exchange = '{stock_exchange}'
-            """
-            exists = pd.read_sql_query(query, self.engine)
-            # import pdb;pdb.set_trace()
-            if len(exists) > 0:
-                exist_dates = exists['date'].sort_values()
-                begin_date = None
-                for e in exist_dates:
-                    if begin_date is None:
-                        begin_date = e
+        stock_exchanges = DailyTransaction.STOCK_EXCHANGES
+        day = str(date.day).zfill(2)
+        month = str(date.month).zfill(2)
+        year = date.year
+        with archive:
+            # exchanges land in separate partitions, so their files can be loaded independently
+            with ThreadPoolExecutor(max_workers = self.workers) as executor:
+                futures = []
+                for stock_exchange in stock_exchanges:
+                    if mode == 'eod':
+                        file_path = DailyTransaction.EOD_FILE_FORMAT.format(stock_exchange, day, month, year)
                     else:
-                        for _ in range(1,(e - begin_date).days):
-                            begin_date = begin_date + timedelta(days = 1)
-                            print(f"Update missing data on date {begin_date}")
-                            update_df = df[(df['date'] == begin_date.strftime('%Y-%m-%d')) & (df['stock_exchange'] == stock_exchange)]
-                            # perform update on row
-                            for index, row in update_df.iterrows():
-                                query = text(f""" 
-                                    INSERT INTO {self.schema}.{self.table}
-                                    VALUES (
-                                        '{stock_exchange}', 
-                                        '{row["stock_code"]}', 
-                                        '{row["date"].strftime('%Y-%m-%d')}',
-                                        {row["open_price"]},
-                                        {row["highest_price"]},
-                                        {row["lowest_price"]},
-                                        {row["close_price"]},
-                                        {row["volume"]}
-                                    )
-                                    ON CONFLICT ON CONSTRAINT transaction_unique_key DO NOTHING;""")
-                                try:
-                                    self.engine.execute(query)
-                                except exc.IntegrityError:
-                                    print(f"Foreign key constraint. Stock code {row['stock_code']} removed due to violation")
-                                    continue
-                                print(f"{stock_exchange}: {index + 1} rows updated")
-                        begin_date = begin_date + timedelta(days = 1)
-            else:
-                begin_date = min(df['date']).date()
-
-            while begin_date <= date:
-                print(f"Update new data on date {begin_date}")
-                update_df = df[(df['date'] == begin_date.strftime('%Y-%m-%d')) & (df['stock_exchange'] == stock_exchange)]
-                # perform update on row
-                for index, row in update_df.iterrows():
-                    query = text(f""" 
-                        INSERT INTO {self.schema}.{self.table}
-                        VALUES (
-                            '{stock_exchange}', 
-                            '{row["stock_code"]}', 
-                            '{row["date"].strftime('%Y-%m-%d')}',
-                            {row["open_price"]},
-                            {row["highest_price"]},
-                            {row["lowest_price"]},
-                            {row["close_price"]},
-                            {row["volume"]}
-                        )
-                        ON CONFLICT ON CONSTRAINT transaction_unique_key DO NOTHING;""")
-                    try:
-                        self.engine.execute(query)
-                    except exc.IntegrityError:
-                        print(f"Foreign key constraint. Stock code {row['stock_code']} removed due to violation")
-                        continue
-                    print(f"{stock_exchange}: {index + 1} rows updated")
-                begin_date = begin_date + timedelta(days = 1)
+                        file_path = DailyTransaction.UPTO_FILE_FORMAT.format(stock_exchange, day, month, year)
+                    futures.append(executor.submit(self._crawl_exchange, archive, file_path, stock_exchange, date, mode, digest))
+                for future in futures:
+                    future.result()
         return True
 
-    def work(self):
-        if os.path.exists(DailyTransaction.ROOT_PATH):
-            shutil.rmtree(DailyTransaction.ROOT_PATH)
-        os.makedirs(DailyTransaction.ROOT_PATH)
+    def _crawl_exchange(self, archive, file_path, stock_exchange, date, mode, digest):
+        """Load the missing rows of one exchange file of an opened archive
+        """
+        if stock_exchange in self._start_coverage([stock_exchange], digest):
+            print(f"{file_path} has already been loaded. Skipping the file")
+            self.report.count(stock_exchange, 'archives_skipped')
+            return
+        ranges = self._covered_ranges([stock_exchange])
+        exists = None
+        if len(ranges) == 0:
+            # an eod archive only holds its own day
+            exists = self._existing_keys(self.table, 'stock_code', date, stock_exchange, since = date if mode == 'eod' else None)
+        chunks = self.report.timed_iter('parse', stock_exchange, read_cafef_csv(archive, file_path, 'stock_code'))
+        for df in iter_in_background(chunks):
+            df['stock_exchange'] = stock_exchange
+            missing = self._missing_rows(df, 'stock_code', 'stock_exchange', date, ranges, exists, feed = stock_exchange)
+            self._load_transaction(missing, stock_exchange, self._chunk_coverage(df, 'stock_exchange', date, digest))
+        self._complete_coverage([stock_exchange], digest)
 
-        # get minimum date from the table
-        end_date = datetime.today().date()
-        found_last_updated_day = False
-        while not found_last_updated_day:
-            found_last_updated_day = self._crawl(end_date, mode = 'upto')
-            if not found_last_updated_day:
-                end_date = end_date - timedelta(days = 1)
+    def _probe_latest(self):
+        """Find the newest published Upto archives with lightweight requests
 
-        end_date = datetime.today().date()
-        found_last_updated_day = False
-        while not found_last_updated_day:
-            found_last_updated_day = self._crawl_index(end_date, mode = 'upto')
-            if not found_last_updated_day:
-                end_date = end_date - timedelta(days = 1)
+        Candidate dates are probed PROBE_WINDOW at a time and concurrently, walking back from today.
 
+        Returns:
+            tuple: (date of the transaction archive, date of the index archive)
+        """
+        today = datetime.today().date()
+        latest = {'transaction' : None, 'index' : None}
+        offset = 0
+        while None in latest.values():
+            if offset >= DailyTransaction.MAX_PROBE_DAYS:
+                raise RuntimeError(f"No archive found in the last {DailyTransaction.MAX_PROBE_DAYS} days")
+            candidates = {}
+            for i in range(offset, offset + DailyTransaction.PROBE_WINDOW):
+                date = today - timedelta(days = i)
+                if latest['transaction'] is None:
+                    candidates[('transaction', date)] = self._archive_url(DailyTransaction.UP_TO_TRANSACTION_FORMAT_URL, date)
+                if latest['index'] is None:
+                    candidates[('index', date)] = self._archive_url(DailyTransaction.UPTO_INDEX_FORMAT_URL, date)
+            with ThreadPoolExecutor(max_workers = len(candidates)) as executor:
+                published = dict(zip(candidates.keys(), executor.map(is_published, candidates.values())))
+            for (feed, date), found in published.items():
+                if found and (latest[feed] is None or date > latest[feed]):
+                    latest[feed] = date
+            offset += DailyTransaction.PROBE_WINDOW
+        print(f"Latest transaction archive: {latest['transaction']}, latest index archive: {latest['index']}")
+        return latest['transaction'], latest['index']
 
+    def _last_ingested_date(self, table, feeds):
+        """Date up to which every feed of table is loaded, None for a cold start
 
-if __name__ == '__main__':
-    ds = DailyTransaction()
-    ds.work()
+        The coverage table is used when all feeds have one, otherwise the table itself is scanned.
+        """
+        query = text(f"""SELECT feed, MAX(last_date) AS date
+            FROM {self.schema}.{self.coverage_table}
+            WHERE complete AND feed = ANY(:feeds)
+            GROUP BY feed
+        """)
+        watermarks = pd.read_sql_query(query, self.engine, params = {'feeds' : list(feeds)})
+        if len(watermarks) == len(feeds):
+            # the least advanced feed decides what has to be downloaded
+            return pd.Timestamp(watermarks['date'].min()).date()
+        query = f"""SELECT MAX(date) AS date FROM {self.schema}.{table}"""
+        last_date = pd.read_sql_query(query, self.engine)['date'].iloc[0]
+        if last_date is None or pd.isnull(last_date):
+            return None
+        return pd.Timestamp(last_date).date()
+
+    def _update(self, crawl, table, feeds, latest_date):
+        """Bring a feed up to latest_date
+
+        In incremental mode only the eod archives of the days after the last ingested date are downloaded.
+        The Upto archive is used for a cold start, for a gap longer than max_gap_days, or in upto mode.
+
+        Args:
+            crawl (callable): _crawl or _crawl_index
+            table (str): table filled by crawl
+            feeds (list): feeds of table, i.e. stock exchanges or stock indexes
+            latest_date (datetime.date): date of the newest published archive
+        """
+        last_date = self._last_ingested_date(table, feeds) if self.update_mode == 'incremental' else None
+        if last_date is None or (latest_date - last_date).days > self.max_gap_days:
+            crawl(latest_date, mode = 'upto')
+            return
+        dates = [last_date + timedelta(days = i) for i in range(1, (latest_date - last_date).days + 1)]
+        self._backfill(crawl, dates)
 
-        
-            
+    def _backfill(self, crawl, dates):
+        """Download the eod archives of dates concurrently and load them in date order
 
+        The archives are revalidated against the download cache. A failed load stops the backfill, so the days
+        after it are not loaded before it and the next run starts again from the failed day.
+
+        Args:
+            crawl (callable): _crawl or _crawl_index
+            dates (list): dates to load
+        """
+        if crawl == self._crawl:
+            url_format, feed = DailyTransaction.EOD_TRANSACTION_FORMAT_URL, 'transaction'
+        else:
+            url_format, feed = DailyTransaction.EOD_INDEX_FORMAT_URL, 'index'
+        items = [(date, self._archive_url(url_format, date)) for date in dates]
+        # only the time spent waiting for the next archive counts, the rest overlaps with loading
+        for date, url, content in self.report.timed_iter('download', feed, self.downloader.iter_fetch(items)):
+            if content is None:
+                print(f"No archive for day {date}, probably not a trading day. Skipping the date")
+                continue
+            crawl(date, mode = 'eod', downloaded = (self._open_archive(content, feed), content_digest(content)))
+
+    def backfill(self, start_date, end_date = None):
+        """Load the eod archives of every day between start_date and end_date, both included
+
+        Args:
+            start_date (datetime.date): first day to load
+            end_date (datetime.date, optional): last day to load. Defaults to the latest published day.
+        """
+        self._stock_codes = None
+        if end_date is None:
+            end_date = min(self._probe_latest())
+        dates = [start_date + timedelta(days = i) for i in range((end_date - start_date).days + 1)]
+        if self.workers > 1:
+            with ThreadPoolExecutor(max_workers = 2) as executor:
+                futures = [
+                    executor.submit(self._backfill, self._crawl, dates),
+                    executor.submit(self._backfill, self._crawl_index, dates)
+                ]
+                for future in futures:
+                    future.result()
+        else:
+            self._backfill(self._crawl, dates)
+            self._backfill(self._crawl_index, dates)
+
+    def update_transactions(self, latest_date):
+        """Bring the transaction table up to latest_date
+
+        Args:
+            latest_date (datetime.date): date of the newest published transaction archive
+        """
+        self._stock_codes = None
+        # stock codes added since the last run make earlier quarantined rows loadable
+        replay_quarantine(self.engine, self.schema)
+        self._update(self._crawl, self.table, DailyTransaction.STOCK_EXCHANGES, latest_date)
+
+    def update_indexes(self, latest_date):
+        """Bring the stock_index table up to latest_date
+
+        Args:
+            latest_date (datetime.date): date of the newest published index archive
+        """
+        self._update(self._crawl_index, self.index_table, DailyTransaction.STOCK_INDEXES, latest_date)
+
+    def work(self):
+        transaction_date, index_date = self._probe_latest()
+        if self.workers > 1:
+            # the index feed is independent of the transaction feed
+            with ThreadPoolExecutor(max_workers = 2) as executor:
+                futures = [
+                    executor.submit(self.update_transactions, transaction_date),
+                    executor.submit(self.update_indexes, index_date)
+                ]
+                for future in futures:
+                    future.result()
+        else:
+            self.update_transactions(transaction_date)
+            self.update_indexes(index_date)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = 'Load daily transaction and index data from CafeF')
+    parser.add_argument('--load-mode', choices = DailyTransaction.LOAD_MODES, default = 'bulk',
+        help = 'row: one INSERT per row, bulk: COPY to a staging table and merge once per exchange')
+    parser.add_argument('--workers', type = int, default = 1,
+        help = 'number of exchange files loaded concurrently, each on its own pooled connection')
+    parser.add_argument('--cache-size', type = int, default = 1024,
+        help = 'maximum size of the download cache in MB')
+    parser.add_argument('--update-mode', choices = DailyTransaction.UPDATE_MODES, default = 'incremental',
+        help = 'upto: always load the full history archive, incremental: load the eod archives of the missing days')
+    parser.add_argument('--max-gap-days', type = int, default = 30,
+        help = 'in incremental mode, fall back to the full history archive for gaps longer than this')
+    parser.add_argument('--backfill-from', type = lambda d: datetime.strptime(d, '%Y-%m-%d').date(),
+        help = 'YYYY-MM-DD. Load the eod archives from this date up to the latest published day instead of a normal update')
+    parser.add_argument('--report', help = 'path of the JSON run report')
+    parser.add_argument('--prometheus', help = 'path of the Prometheus textfile with the run metrics')
+    parser.add_argument('--base-url', default = DailyTransaction.BASE_URL,
+        help = 'url serving the CafeF ami_data folders')
+    args = parser.parse_args()
+    ds = DailyTransaction(
+        load_mode = args.load_mode,
+        workers = args.workers,
+        cache_size = args.cache_size * 1024 * 1024,
+        update_mode = args.update_mode,
+        max_gap_days = args.max_gap_days,
+        base_url = args.base_url
+    )
+    try:
+        if args.backfill_from is not None:
+            ds.backfill(args.backfill_from)
+        else:
+            ds.work()
+    finally:
+        ds.report.print_summary()
+        if args.report is not None:
+            ds.report.write_json(args.report)
+        if args.prometheus is not None:
+            ds.report.write_prometheus(args.prometheus)
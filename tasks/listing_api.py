@@ -0,0 +1,151 @@
+import json
+import re
+
+import lxml.html
+import pandas as pd
+import requests
+from requests.adapters import HTTPAdapter
+
+from utils.stock_info import STOCK_INFO_COLUMNS
+
+TAG_PATTERN = re.compile(r'<[^>]+>')
+
+def parse_vn_numbers(values : pd.Series) -> pd.Series:
+    """Parse numbers written with '.' as thousands separator and ',' as decimal separator, all at once
+
+    Values that are not numbers become NaN.
+    """
+    cleaned = values.astype(str).str.strip().str.replace('.', '', regex = False).str.replace(',', '.', regex = False)
+    return pd.to_numeric(cleaned, errors = 'coerce')
+
+def strip_tags(value : str) -> str:
+    return TAG_PATTERN.sub('', str(value)).strip()
+
+def listing_frame(rows : list, cells : tuple, stock_exchange : str) -> pd.DataFrame:
+    """Build listings from the cell texts of a listing table, parsing the numbers and dates of every row at once
+
+    Rows that cannot be parsed are skipped and reported.
+
+    Args:
+        rows (list): cell texts of every row
+        cells (tuple): cell positions of (company_name, free_float, first_transaction_date, stock_code, listing_volume)
+        stock_exchange (str): stock exchange of the listings
+
+    Returns:
+        pd.DataFrame: rows with STOCK_INFO_COLUMNS
+    """
+    fields = ['company_name', 'free_float', 'first_transaction_date', 'stock_code', 'listing_volume']
+    width = max(cells) + 1
+    raw = pd.DataFrame([[row[i] for i in cells] for row in rows if len(row) >= width], columns = fields, dtype = str)
+    df = pd.DataFrame({
+        'company_name' : raw['company_name'].str.strip(),
+        'free_float' : parse_vn_numbers(raw['free_float']),
+        'first_transaction_date' : pd.to_datetime(raw['first_transaction_date'].str.strip(), format = '%d/%m/%Y', errors = 'coerce'),
+        'stock_code' : raw['stock_code'].str.strip(),
+        'listing_volume' : parse_vn_numbers(raw['listing_volume']),
+        'stock_exchange' : stock_exchange
+    }, columns = STOCK_INFO_COLUMNS)
+    invalid = df[['free_float', 'first_transaction_date', 'listing_volume']].isna().any(axis = 1)
+    if invalid.any():
+        print(f"Skipped {invalid.sum()} {stock_exchange} listings that could not be parsed: {', '.join(df.loc[invalid, 'stock_code'])}")
+        df = df[~invalid]
+    return df.astype({'free_float' : 'int64', 'listing_volume' : 'int64'}).reset_index(drop = True)
+
+class ListingHttpBackend(object):
+    """Read a listing table through the AJAX endpoint that fills it, instead of driving a browser
+
+    Subclasses implement _fetch_page, which returns the cell texts of the rows of one page and the number of pages,
+    and set the CELLS positions read by listing_frame.
+    """
+    PAGE_SIZE = 1000
+    TIMEOUT = 30
+    HEADERS = {
+        'User-Agent' : 'Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/92.0.4515.107 Safari/537.36',
+        'X-Requested-With' : 'XMLHttpRequest'
+    }
+    def __init__(self, session : requests.Session = None):
+        if session is None:
+            session = ListingHttpBackend.new_session()
+        self.session = session
+
+    @staticmethod
+    def new_session() -> requests.Session:
+        """Session with pooled connections, retries and the headers the endpoints expect
+        """
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections = 4, pool_maxsize = 4, max_retries = 3)
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        session.headers.update(ListingHttpBackend.HEADERS)
+        return session
+
+    def _fetch_page(self, page : int):
+        raise NotImplementedError
+
+    def fetch(self) -> pd.DataFrame:
+        """Read every page of the listing
+
+        Returns:
+            pd.DataFrame: rows with STOCK_INFO_COLUMNS
+        """
+        rows = []
+        page, total_pages = 1, 1
+        while page <= total_pages:
+            page_rows, total_pages = self._fetch_page(page)
+            rows.extend(page_rows)
+            print(f"{type(self).__name__}: page {page}/{total_pages}, {len(page_rows)} rows")
+            page += 1
+        return listing_frame(rows, type(self).CELLS, type(self).STOCK_EXCHANGE)
+
+class HSXHttpBackend(ListingHttpBackend):
+    """jqGrid JSON endpoint behind the symbols-grid table of hsx.vn
+    """
+    URL = 'https://www.hsx.vn/Modules/Listed/Web/SymbolList'
+    STOCK_EXCHANGE = 'HSX'
+    # the grid cells are id, stock_code, isin_code, figi_code, listing_business, listing_volume, fee_float, listing_date
+    CELLS = (4, 6, 7, 1, 5)
+
+    def _fetch_page(self, page):
+        response = self.session.get(HSXHttpBackend.URL, params = {
+            '_search' : 'false',
+            'rows' : ListingHttpBackend.PAGE_SIZE,
+            'page' : page,
+            'sidx' : 'id',
+            'sord' : 'asc'
+        }, timeout = ListingHttpBackend.TIMEOUT)
+        response.raise_for_status()
+        data = json.loads(response.content)
+        rows = [[strip_tags(cell) for cell in item['cell']] for item in data['rows']]
+        return rows, int(data['total'])
+
+class HNXHttpBackend(ListingHttpBackend):
+    """Endpoint returning the html rows of the _tableDatas table of hnx.vn
+
+    The same endpoint serves the listed (HNX) and the UPCOM tables, depending on URL.
+    """
+    URL = 'https://hnx.vn/ModuleIssuer/List_ChungKhoan_NY/SearchAndNextPageDSNY'
+    STOCK_EXCHANGE = 'HNX'
+    # cell positions of (company_name, free_float, first_transaction_date, stock_code, listing_volume)
+    CELLS = (2, 6, 4, 1, 5)
+
+    def _fetch_page(self, page):
+        response = self.session.post(type(self).URL, data = {
+            'p_keysearch' : '',
+            'pColOrder' : 'STOCK_CODE',
+            'pOrderType' : 'ASC',
+            'pCurrentPage' : page,
+            'pRecordOnPage' : ListingHttpBackend.PAGE_SIZE,
+            'pIsSearch' : 0
+        }, timeout = ListingHttpBackend.TIMEOUT)
+        response.raise_for_status()
+        # the endpoint answers {"Content" : "<table html>", "TotalPage" : n}
+        data = json.loads(response.content)
+        tree = lxml.html.fromstring(data['Content'])
+        rows = [[cell.text_content() for cell in row.xpath('./td')] for row in tree.xpath('//tr[td]')]
+        return rows, int(data.get('TotalPage', 1))
+
+class UPCOMHttpBackend(HNXHttpBackend):
+    URL = 'https://hnx.vn/ModuleIssuer/List_ChungKhoan_UC/SearchAndNextPageDSUC'
+    STOCK_EXCHANGE = 'UPCOM'
+    # cell positions of (company_name, free_float, first_transaction_date, stock_code, listing_volume), like UPCOMStocks
+    CELLS = (2, 5, 3, 1, 4)
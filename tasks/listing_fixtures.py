@@ -0,0 +1,70 @@
+import hashlib
+import json
+import os
+from urllib.parse import urlparse
+
+from tasks.listing_api import ListingHttpBackend
+
+def fixture_name(method : str, url : str, params : dict = None, data : dict = None) -> str:
+    """File name of the snapshot of one request, stable across runs
+
+    Args:
+        method (str): 'get' or 'post'
+        url (str): url of the request
+        params (dict, optional): query parameters. Defaults to None.
+        data (dict, optional): form data. Defaults to None.
+
+    Returns:
+        str: <host>-<method>-<hash of the request>.body
+    """
+    key = json.dumps([method, url, params or {}, data or {}], sort_keys = True, default = str)
+    digest = hashlib.sha1(key.encode('utf-8')).hexdigest()[:16]
+    return f"{urlparse(url).netloc}-{method}-{digest}.body"
+
+class RecordingSession(object):
+    """Session that saves the body of every listing response under root, to be replayed by ReplaySession
+    """
+    def __init__(self, root : str, session = None):
+        self.root = root
+        self.session = session if session is not None else ListingHttpBackend.new_session()
+        os.makedirs(root, exist_ok = True)
+
+    def _request(self, method, url, params = None, data = None, **kwargs):
+        response = getattr(self.session, method)(url, params = params, data = data, **kwargs)
+        response.raise_for_status()
+        with open(os.path.join(self.root, fixture_name(method, url, params, data)), 'wb') as f:
+            f.write(response.content)
+        return response
+
+    def get(self, url, params = None, **kwargs):
+        return self._request('get', url, params = params, **kwargs)
+
+    def post(self, url, data = None, **kwargs):
+        return self._request('post', url, data = data, **kwargs)
+
+class ReplayResponse(object):
+    status_code = 200
+    def __init__(self, content : bytes):
+        self.content = content
+
+    def raise_for_status(self):
+        pass
+
+class ReplaySession(object):
+    """Session answering the listing requests with the snapshots of a RecordingSession, without network
+    """
+    def __init__(self, root : str):
+        self.root = root
+
+    def _request(self, method, url, params = None, data = None, **kwargs):
+        path = os.path.join(self.root, fixture_name(method, url, params, data))
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"No snapshot of {method.upper()} {url} {params or data} in {self.root}")
+        with open(path, 'rb') as f:
+            return ReplayResponse(f.read())
+
+    def get(self, url, params = None, **kwargs):
+        return self._request('get', url, params = params, **kwargs)
+
+    def post(self, url, data = None, **kwargs):
+        return self._request('post', url, data = data, **kwargs)
@@ -0,0 +1,108 @@
+import argparse
+import traceback
+
+from utils.utilities import get_engine
+from utils.quarantine import replay_quarantine
+from utils.stock_info import sync_stock_info, write_changes
+from tasks.listing_fixtures import RecordingSession, ReplaySession
+from tasks.browser_pool import BrowserPool
+
+class ListingScraper(object):
+    """Update stock_info with the listing table of one stock exchange
+
+    The listing is read through HTTP_BACKEND, or by driving a browser on STOCK_URL when the backend fails or when
+    the selenium backend is chosen. Subclasses implement _get_company_data, which scrapes the listing page with the
+    drivers of a pool, and set STOCK_URL, HTTP_BACKEND and the CELLS positions of the page read by listing_frame.
+    """
+    STOCK_URL = None
+    HTTP_BACKEND = None
+    # cell positions of (company_name, free_float, first_transaction_date, stock_code, listing_volume)
+    CELLS = None
+    BACKENDS = ['http', 'selenium', 'replay']
+    def __init__(self, headless = True, backend = 'http', browser_pool = None, browsers = 2, fixtures = None, engine = None):
+        if backend not in ListingScraper.BACKENDS:
+            raise ValueError(f"Unknown backend {backend}. Expected one of {ListingScraper.BACKENDS}")
+        if backend == 'replay' and fixtures is None:
+            raise ValueError("The replay backend needs the folder of the recorded fixtures")
+        self.backend = backend
+        self.headless = headless
+        # a pool shared with other scrapers, otherwise one of `browsers` drivers is started when needed
+        self.browser_pool = browser_pool
+        self.browsers = browsers
+        # folder where the http backend records its responses, or where the replay backend reads them
+        self.fixtures = fixtures
+
+        self.schema = 'public'
+        self.table = 'stock_info'
+        self.engine = engine if engine is not None else get_engine()
+
+    @property
+    def stock_exchange(self) -> str:
+        return type(self).HTTP_BACKEND.STOCK_EXCHANGE
+
+    def _get_company_data(self, pool):
+        raise NotImplementedError
+
+    def _save(self, df):
+        return sync_stock_info(self.engine, df, self.schema, self.table)
+
+    def _scrape_with_browser(self):
+        pool = self.browser_pool
+        if pool is None:
+            pool = BrowserPool(size = self.browsers, headless = self.headless)
+        try:
+            return self._get_company_data(pool)
+        finally:
+            # quit the browsers unless the pool is shared
+            if pool is not self.browser_pool:
+                pool.close()
+
+    def _fetch_http(self):
+        session = None
+        if self.backend == 'replay':
+            session = ReplaySession(self.fixtures)
+        elif self.fixtures is not None:
+            session = RecordingSession(self.fixtures)
+        return type(self).HTTP_BACKEND(session = session).fetch()
+
+    def work(self):
+        df = None
+        if self.backend == 'replay':
+            df = self._fetch_http()
+        elif self.backend == 'http':
+            try:
+                df = self._fetch_http()
+                if len(df) == 0:
+                    raise ValueError("The HTTP backend returned no rows")
+            except Exception:
+                print(traceback.format_exc())
+                print("HTTP backend failed, falling back to selenium")
+                df = None
+        if df is None:
+            df = self._scrape_with_browser()
+
+        # save the new and changed listings
+        changes = self._save(df)
+
+        # load the transactions quarantined while their stock codes were unknown
+        replay_quarantine(self.engine, self.schema)
+        return changes
+
+    @classmethod
+    def main(cls):
+        """Command line entry point of a scraper module
+        """
+        parser = argparse.ArgumentParser(description = 'Update stock_info with the listings of the stock exchange')
+        parser.add_argument('--backend', choices = ListingScraper.BACKENDS, default = 'http',
+            help = 'http: call the endpoints behind the listing table, selenium: drive a headless chrome, replay: read the responses recorded with --fixtures')
+        parser.add_argument('--fixtures', default = None,
+            help = 'folder where the http backend records its responses, read back by the replay backend')
+        parser.add_argument('--browsers', type = int, default = 2,
+            help = 'size of the browser pool of the selenium backend')
+        parser.add_argument('--changes', default = None,
+            help = 'write the inserted, updated and delisted stock codes to this JSON file')
+        args = parser.parse_args()
+        hs = cls(backend = args.backend, browsers = args.browsers, fixtures = args.fixtures)
+        changes = hs.work()
+        if args.changes is not None:
+            write_changes(changes, args.changes)
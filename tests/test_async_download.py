@@ -0,0 +1,130 @@
+import threading
+import time
+from datetime import date
+
+import pytest
+
+pytest.importorskip('aiohttp')
+pytest.importorskip('pandas')
+
+from benchmarks.cafef_server import CafeFServer, trading_days, write_archives
+from tasks.daily_transaction import DailyTransaction
+from utils.async_download import AsyncDownloader
+from utils.download_cache import DownloadCache
+
+END_DATE = date(2022, 12, 30)
+EOD_DAYS = 5
+
+def _path(day) -> str:
+    return DailyTransaction.EOD_TRANSACTION_FORMAT_URL.format('', day.strftime('%Y%m%d'), day.strftime('%d%m%Y'))
+
+def _items(server, days) -> list:
+    return [(day, server.base_url + _path(day)) for day in days]
+
+@pytest.fixture(scope = 'module')
+def archives(tmp_path_factory):
+    root = tmp_path_factory.mktemp('cafef')
+    write_archives(str(root), END_DATE, n_tickers = 3, n_years = 1, eod_days = EOD_DAYS)
+    days = [day.date() for day in trading_days(END_DATE, 1)[-EOD_DAYS:]]
+    return root, days
+
+def _content(root, day) -> bytes:
+    return (root / _path(day).lstrip('/')).read_bytes()
+
+def test_missing_archive_is_none(archives):
+    root, days = archives
+    holiday = date(2022, 12, 31)
+    with CafeFServer(str(root)) as server:
+        results = {key : content for key, _, content in AsyncDownloader(requests_per_second = 100).iter_fetch(_items(server, days + [holiday]))}
+    assert results[holiday] is None
+    assert all(results[day] == _content(root, day) for day in days)
+
+def test_server_errors_are_retried_with_backoff(archives):
+    root, days = archives
+    with CafeFServer(str(root), failures = {_path(days[0]) : 2}) as server:
+        downloader = AsyncDownloader(requests_per_second = 100, retries = 3, backoff = 0.1)
+        start = time.perf_counter()
+        results = list(downloader.iter_fetch(_items(server, days[:1])))
+        elapsed = time.perf_counter() - start
+        requests = server.requests
+    assert results == [(days[0], server.base_url + _path(days[0]), _content(root, days[0]))]
+    assert requests.count(_path(days[0])) == 3
+    # two retries, after 0.1s then 0.2s
+    assert elapsed >= 0.3
+
+def test_server_errors_fail_after_the_last_retry(archives):
+    root, days = archives
+    with CafeFServer(str(root), failures = {_path(days[0]) : 10}) as server:
+        downloader = AsyncDownloader(requests_per_second = 100, retries = 1, backoff = 0.01)
+        with pytest.raises(Exception):
+            list(downloader.iter_fetch(_items(server, days[:1])))
+
+def test_results_go_through_the_bounded_queue(archives):
+    root, days = archives
+    with CafeFServer(str(root)) as server:
+        downloader = AsyncDownloader(concurrency = 2, requests_per_second = 100, max_pending = 1)
+        results = []
+        for key, _, content in downloader.iter_fetch(_items(server, days)):
+            # a slow consumer, the downloader waits on the queue
+            time.sleep(0.05)
+            results.append((key, content))
+    assert [key for key, _ in results] == days
+    assert all(content == _content(root, key) for key, content in results)
+
+def test_results_keep_the_order_of_the_items(archives):
+    root, days = archives
+    # the first day is retried, so it completes after the others
+    with CafeFServer(str(root), failures = {_path(days[0]) : 1}) as server:
+        downloader = AsyncDownloader(requests_per_second = 100, backoff = 0.2)
+        keys = [key for key, _, _ in downloader.iter_fetch(_items(server, days))]
+    assert keys == days
+
+def test_downloads_stop_when_the_consumer_stops(archives):
+    root, days = archives
+    before = threading.active_count()
+    with CafeFServer(str(root)) as server:
+        downloader = AsyncDownloader(concurrency = 1, requests_per_second = 100, max_pending = 1)
+        with pytest.raises(ValueError):
+            for key, _, _ in downloader.iter_fetch(_items(server, days)):
+                raise ValueError('load failed')
+        requests = server.requests
+    # the download thread ends instead of waiting for room in the queue
+    assert threading.active_count() == before
+    assert len(requests) < len(days)
+
+def test_cached_archives_are_revalidated(archives, tmp_path, capsys):
+    root, days = archives
+    cache = DownloadCache(str(tmp_path))
+    with CafeFServer(str(root)) as server:
+        downloader = AsyncDownloader(requests_per_second = 100, cache = cache)
+        first = list(downloader.iter_fetch(_items(server, days[:2])))
+        capsys.readouterr()
+        second = list(downloader.iter_fetch(_items(server, days[:2])))
+    assert capsys.readouterr().out.count('not modified') == 2
+    assert second == first
+    assert all(cache.lookup(url)[0] == content for _, url, content in second)
+
+def test_concurrent_iter_fetch_on_one_downloader(archives):
+    root, days = archives
+    results, errors = {}, []
+    with CafeFServer(str(root), delay = 0.2) as server:
+        downloader = AsyncDownloader(requests_per_second = 100)
+
+        def consume(name, consumer_days):
+            try:
+                results[name] = [key for key, _, _ in downloader.iter_fetch(_items(server, consumer_days))]
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target = consume, args = (name, consumer_days)) for name, consumer_days in [('first', days[:3]), ('second', days[3:])]]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+    assert errors == []
+    assert sorted(results['first']) == days[:3]
+    assert sorted(results['second']) == days[3:]
+    # both runs overlap: every download waits 0.2s on the server, one run after the other would take 0.4s
+    assert elapsed < 0.4
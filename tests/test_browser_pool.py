@@ -0,0 +1,67 @@
+import threading
+import time
+
+import pytest
+
+pytest.importorskip('selenium')
+
+from tasks.browser_pool import BrowserPool
+
+class _FakeDriver(object):
+    def quit(self):
+        pass
+
+def _fake_pool(size : int, startup : float = 0.0) -> BrowserPool:
+    pool = BrowserPool(size = size)
+    starts = []
+
+    def start_driver():
+        starts.append(threading.current_thread().name)
+        time.sleep(startup)
+        driver = _FakeDriver()
+        pool._drivers.append(driver)
+        return driver
+
+    pool._start_driver = start_driver
+    pool.starts = starts
+    return pool
+
+def test_map_pages_uses_one_driver_per_range():
+    pool = _fake_pool(size = 2)
+    # a driver is already idle, the second range must still get its own driver
+    with pool.driver():
+        pass
+    used = []
+
+    def scrape_pages(driver, pages):
+        used.append(driver)
+        time.sleep(0.1)
+        return pages
+
+    assert pool.map_pages([1, 2, 3, 4], scrape_pages) == [1, 2, 3, 4]
+    assert len(set(map(id, used))) == 2
+    assert len(pool.starts) == 2
+
+def test_drivers_start_concurrently():
+    pool = _fake_pool(size = 3, startup = 0.2)
+    start = time.perf_counter()
+    pool.map_pages([1, 2, 3], lambda driver, pages: pages)
+    assert len(pool.starts) == 3
+    assert time.perf_counter() - start < 0.5
+
+def test_borrowers_wait_when_the_pool_is_full():
+    pool = _fake_pool(size = 1)
+    assert pool.map_pages(list(range(10)), lambda driver, pages: pages) == list(range(10))
+    results = []
+
+    def borrow():
+        with pool.driver() as driver:
+            results.append(driver)
+
+    threads = [threading.Thread(target = borrow) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(pool.starts) == 1
+    assert len(set(map(id, results))) == 1
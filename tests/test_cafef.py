@@ -0,0 +1,34 @@
+import threading
+
+import pytest
+
+pytest.importorskip('pandas')
+
+from utils.cafef import iter_in_background
+
+def test_producer_stops_when_the_consumer_fails():
+    produced = []
+
+    def chunks():
+        for i in range(100):
+            produced.append(i)
+            yield i
+
+    before = threading.active_count()
+    with pytest.raises(ValueError):
+        for chunk in iter_in_background(chunks(), maxsize = 1):
+            raise ValueError('load failed')
+    # the producer thread is joined instead of blocking on a full queue
+    assert threading.active_count() == before
+    assert len(produced) < 100
+
+def test_producer_errors_reach_the_consumer():
+    def chunks():
+        yield 1
+        raise ValueError('bad csv')
+
+    consumed = []
+    with pytest.raises(ValueError, match = 'bad csv'):
+        for chunk in iter_in_background(chunks()):
+            consumed.append(chunk)
+    assert consumed == [1]
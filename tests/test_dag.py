@@ -0,0 +1,32 @@
+import pytest
+
+from utils.dag import Dag
+
+def _fail():
+    raise ValueError('website down')
+
+def test_failed_dependency_skips_its_dependents():
+    dag = Dag()
+    dag.add('listing', _fail)
+    dag.add('load', lambda listing: listing, ['listing'])
+    with pytest.raises(RuntimeError):
+        dag.run()
+    assert dag.skipped == ['load']
+
+def test_task_runs_after_failed_tasks_it_only_waits_for():
+    order = []
+    dag = Dag()
+    dag.add('probe', lambda: 'latest')
+    dag.add('hnx', lambda: order.append('hnx'))
+    dag.add('upcom', _fail)
+    dag.add('transaction', lambda latest: order.append(('transaction', latest)), ['probe'], after = ['hnx', 'upcom'])
+    with pytest.raises(RuntimeError, match = 'upcom'):
+        dag.run()
+    assert order == ['hnx', ('transaction', 'latest')]
+    assert dag.skipped == []
+    assert 'transaction' in dag.results
+
+def test_unknown_after_task_is_rejected():
+    dag = Dag()
+    with pytest.raises(ValueError):
+        dag.add('transaction', lambda: None, after = ['listing'])
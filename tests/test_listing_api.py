@@ -0,0 +1,28 @@
+import pytest
+
+pytest.importorskip('pandas')
+pytest.importorskip('lxml')
+
+from benchmarks.listing_parsers import BACKENDS, SyntheticListingSession
+
+@pytest.mark.parametrize('backend', BACKENDS, ids = lambda backend: backend.STOCK_EXCHANGE)
+def test_backend_reads_every_field_from_its_cell(backend):
+    session = SyntheticListingSession(50)
+    df = backend(session = session).fetch().sort_values('stock_code', ignore_index = True)
+    assert len(df) == 50
+    assert (df['stock_exchange'] == backend.STOCK_EXCHANGE).all()
+    assert df['listing_volume'].tolist() == session.volumes.tolist()
+    # free float and listing volume sit in different cells of every listing page
+    assert df['free_float'].tolist() == session.free_floats.tolist()
+    assert df['company_name'].tolist() == [f'Cong ty co phan {i}' for i in range(50)]
+
+def test_scrapers_read_their_own_exchange():
+    pytest.importorskip('selenium')
+    from tasks.hnx_stock_codes import HNXStocks
+    from tasks.hsx_stock_codes import HNXStocks as HSXStocks
+    from tasks.upcom_stock_codes import UPCOMStocks
+    for scraper in [HSXStocks, HNXStocks, UPCOMStocks]:
+        listing = scraper(backend = 'selenium', engine = object())
+        assert listing.stock_exchange == scraper.HTTP_BACKEND.STOCK_EXCHANGE
+        # the selenium pages and the endpoints lay the cells out the same way
+        assert scraper.CELLS == scraper.HTTP_BACKEND.CELLS
@@ -0,0 +1,35 @@
+import pytest
+
+pd = pytest.importorskip('pandas')
+
+from utils.utilities import coalesce_date_ranges, in_ranges
+
+def _ranges(rows) -> pd.DataFrame:
+    return pd.DataFrame({
+        'feed' : [feed for feed, _, _ in rows],
+        'first_date' : pd.to_datetime([first for _, first, _ in rows]),
+        'last_date' : pd.to_datetime([last for _, _, last in rows])
+    })
+
+def test_overlapping_and_adjacent_ranges_are_merged_per_feed():
+    ranges = _ranges([
+        ('HSX', '2022-12-05', '2022-12-05'),
+        ('HSX', '2022-01-01', '2022-12-02'),
+        ('HSX', '2022-12-03', '2022-12-04'),
+        ('HSX', '2022-06-01', '2022-06-30'),
+        ('HSX', '2022-12-07', '2022-12-07'),
+        ('HNX', '2022-12-05', '2022-12-05')
+    ])
+    merged = coalesce_date_ranges(ranges, 'feed')
+    assert merged.values.tolist() == _ranges([
+        ('HNX', '2022-12-05', '2022-12-05'),
+        ('HSX', '2022-01-01', '2022-12-05'),
+        ('HSX', '2022-12-07', '2022-12-07')
+    ]).values.tolist()
+
+def test_values_are_matched_against_the_ranges():
+    ranges = _ranges([('HSX', '2022-01-03', '2022-01-05'), ('HSX', '2022-01-10', '2022-01-10')])
+    dates = pd.to_datetime(['2022-01-02', '2022-01-03', '2022-01-05', '2022-01-06', '2022-01-10', '2022-01-11']).to_numpy()
+    covered = in_ranges(dates, ranges['first_date'].to_numpy(), ranges['last_date'].to_numpy())
+    assert covered.tolist() == [False, True, True, False, True, False]
+    assert in_ranges(dates, [], []).tolist() == [False] * len(dates)
@@ -0,0 +1,153 @@
+import asyncio
+import queue
+import threading
+from urllib.parse import urlparse
+
+import aiohttp
+
+def _put(results, item, stop, poll_interval = 0.1) -> bool:
+    # a blocking put that gives up once the consumer has stopped
+    while not stop.is_set():
+        try:
+            results.put(item, timeout = poll_interval)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+class AsyncDownloader(object):
+    """Download many archives concurrently with asyncio
+
+    Downloads run on an event loop in a background thread and their results are handed over through a bounded
+    queue, so the caller can parse and load one archive while the next ones are still in flight. Results come
+    out in the order of the items, so a failed load never leaves later dates loaded behind an earlier gap.
+
+    With a DownloadCache, cached urls are revalidated with a conditional request and served from the cache on
+    a 304, and new downloads are stored in the cache with their validators.
+    """
+    RETRY_STATUSES = [429, 500, 502, 503, 504]
+    def __init__(self, concurrency : int = 8, requests_per_second : float = 4.0, retries : int = 3, backoff : float = 1.0, timeout : float = 60, max_pending : int = 4, cache = None):
+        """
+        Args:
+            concurrency (int, optional): maximum number of downloads in flight. Defaults to 8.
+            requests_per_second (float, optional): maximum request rate per host. Defaults to 4.0.
+            retries (int, optional): attempts after the first failure. Defaults to 3.
+            backoff (float, optional): first retry delay in seconds, doubled at every attempt. Defaults to 1.0.
+            timeout (float, optional): total timeout of a request in seconds. Defaults to 60.
+            max_pending (int, optional): downloaded archives waiting for the consumer before downloads pause. Defaults to 4.
+            cache (DownloadCache, optional): cache revalidated and filled by the downloads. Defaults to None.
+        """
+        self.concurrency = concurrency
+        self.requests_per_second = requests_per_second
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.max_pending = max_pending
+        self.cache = cache
+
+    async def _throttle(self, host, host_locks, next_slots):
+        # space the requests to one host by 1 / requests_per_second
+        async with host_locks.setdefault(host, asyncio.Lock()):
+            loop = asyncio.get_running_loop()
+            now = loop.time()
+            next_slot = next_slots.get(host, now)
+            if next_slot > now:
+                await asyncio.sleep(next_slot - now)
+            next_slots[host] = max(now, next_slot) + 1 / self.requests_per_second
+
+    async def _fetch(self, session, host_locks, next_slots, key, url):
+        """Download one url, or reuse the cached copy when the server reports it unchanged
+
+        Returns:
+            tuple: (key, url, content), content is None when the server answers 404
+        """
+        host = urlparse(url).netloc
+        loop = asyncio.get_running_loop()
+        cached, headers = None, {}
+        if self.cache is not None:
+            cached, headers = await loop.run_in_executor(None, self.cache.lookup, url)
+        for attempt in range(self.retries + 1):
+            await self._throttle(host, host_locks, next_slots)
+            try:
+                async with session.get(url, headers = headers) as response:
+                    if response.status == 404:
+                        return key, url, None
+                    if response.status == 304 and cached is not None:
+                        print(f"{url} not modified, using cached archive")
+                        await loop.run_in_executor(None, self.cache.store, url, cached)
+                        return key, url, cached
+                    if response.status not in AsyncDownloader.RETRY_STATUSES:
+                        response.raise_for_status()
+                        content = await response.read()
+                        if self.cache is not None:
+                            await loop.run_in_executor(None, self.cache.store, url, content, response.headers)
+                        return key, url, content
+                    error = aiohttp.ClientResponseError(response.request_info, response.history, status = response.status)
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                if isinstance(e, aiohttp.ClientResponseError) and e.status not in AsyncDownloader.RETRY_STATUSES:
+                    raise
+                error = e
+            if attempt < self.retries:
+                delay = self.backoff * 2 ** attempt
+                print(f"Download of {url} failed ({error}), retrying in {delay:.1f}s")
+                await asyncio.sleep(delay)
+        raise error
+
+    async def _run(self, items, results, stop):
+        # state of this run only: iter_fetch may run on several threads, each with its own event loop
+        host_locks = {}
+        next_slots = {}
+        loop = asyncio.get_running_loop()
+        items = list(items)
+        tasks = {}
+        async with aiohttp.ClientSession(timeout = aiohttp.ClientTimeout(total = self.timeout)) as session:
+            try:
+                for index in range(len(items)):
+                    # at most concurrency downloads run ahead of the next result to hand over, in item order
+                    for ahead in range(index, min(index + self.concurrency, len(items))):
+                        if ahead not in tasks:
+                            tasks[ahead] = asyncio.create_task(self._fetch(session, host_locks, next_slots, *items[ahead]))
+                    result = await tasks.pop(index)
+                    # a blocking put keeps memory bounded when the consumer is slower than the network
+                    if not await loop.run_in_executor(None, _put, results, result, stop):
+                        return
+            finally:
+                for task in tasks.values():
+                    task.cancel()
+
+    def iter_fetch(self, items):
+        """Download items concurrently and yield them in the order of items
+
+        Args:
+            items (list): (key, url) pairs
+
+        Yields:
+            tuple: (key, url, content), content is None for a 404, i.e. no trading on that day
+        """
+        results = queue.Queue(maxsize = self.max_pending)
+        done = object()
+        errors = []
+        stop = threading.Event()
+
+        def run():
+            try:
+                asyncio.run(self._run(items, results, stop))
+            except BaseException as e:
+                errors.append(e)
+            finally:
+                _put(results, done, stop)
+
+        thread = threading.Thread(target = run, daemon = True)
+        thread.start()
+        try:
+            while True:
+                result = results.get()
+                if result is done:
+                    break
+                yield result
+        finally:
+            # a consumer stopping early (e.g. a failed load) ends the downloads instead of leaving them blocked
+            stop.set()
+            thread.join()
+        if len(errors) > 0:
+            raise errors[0]
@@ -0,0 +1,120 @@
+import io
+import queue
+import threading
+import zipfile
+import pandas as pd
+
+# raw CafeF header -> database column
+CAFEF_COLUMNS = {
+    '<Ticker>' : 'ticker',
+    '<DTYYYYMMDD>' : 'date',
+    '<Open>' : 'open_price',
+    '<High>' : 'highest_price',
+    '<Low>' : 'lowest_price',
+    '<Close>' : 'close_price',
+    '<Volume>' : 'volume'
+}
+PRICE_COLUMNS = ['open_price', 'highest_price', 'lowest_price', 'close_price']
+CHUNK_SIZE = 500000
+
+def cafef_dtypes(price_dtype : str = 'float64') -> dict:
+    """Explicit dtypes of the raw CafeF columns, so that read_csv does not infer them
+
+    Args:
+        price_dtype (str, optional): float32 halves the memory of the prices but loses precision
+            against the double precision columns of the database. Defaults to 'float64'.
+    """
+    dtypes = {
+        '<Ticker>' : 'category',
+        '<DTYYYYMMDD>' : 'int32',
+        '<Volume>' : 'int64'
+    }
+    for raw, column in CAFEF_COLUMNS.items():
+        if column in PRICE_COLUMNS:
+            dtypes[raw] = price_dtype
+    return dtypes
+
+def parse_cafef_dates(dates : pd.Series) -> pd.Series:
+    """Convert YYYYMMDD integers to datetimes without going through strings
+    """
+    return pd.to_datetime(pd.DataFrame({
+        'year' : dates // 10000,
+        'month' : dates // 100 % 100,
+        'day' : dates % 100
+    }))
+
+def read_cafef_csv(archive : zipfile.ZipFile, member : str, ticker_column : str, chunksize : int = CHUNK_SIZE, price_dtype : str = 'float64'):
+    """Read a CafeF csv member straight from an opened zip, chunk by chunk
+
+    Args:
+        archive (zipfile.ZipFile): opened CafeF archive
+        member (str): name of the csv inside the archive
+        ticker_column (str): name given to the <Ticker> column, stock_code or stock_index
+        chunksize (int, optional): rows per yielded frame. Defaults to CHUNK_SIZE.
+        price_dtype (str, optional): dtype of the price columns. Defaults to 'float64'.
+
+    Yields:
+        pd.DataFrame: typed rows with the database column names
+    """
+    with archive.open(member) as f:
+        reader = pd.read_csv(
+            f,
+            usecols = list(CAFEF_COLUMNS.keys()),
+            dtype = cafef_dtypes(price_dtype),
+            chunksize = chunksize
+        )
+        for chunk in reader:
+            chunk = chunk.rename(columns = CAFEF_COLUMNS).rename(columns = {'ticker' : ticker_column})
+            chunk['date'] = parse_cafef_dates(chunk['date'])
+            yield chunk
+
+def open_archive(content : bytes) -> zipfile.ZipFile:
+    """Open a downloaded archive in memory, without writing it to disk
+    """
+    return zipfile.ZipFile(io.BytesIO(content), 'r')
+
+def iter_in_background(iterable, maxsize : int = 2, poll_interval : float = 0.1):
+    """Consume an iterable on a background thread
+
+    The producer (e.g. the csv parser) keeps at most maxsize items ahead of the consumer (e.g. the loader),
+    so that parsing the next chunk overlaps with loading the current one while memory stays bounded.
+    When the consumer stops early (e.g. a load fails), the producer stops at its next item instead of
+    waiting forever for room in the queue.
+    """
+    items = queue.Queue(maxsize = maxsize)
+    done = object()
+    errors = []
+    stop = threading.Event()
+
+    def put(item):
+        while not stop.is_set():
+            try:
+                items.put(item, timeout = poll_interval)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce():
+        try:
+            for item in iterable:
+                if not put(item):
+                    return
+        except BaseException as e:
+            errors.append(e)
+        finally:
+            put(done)
+
+    thread = threading.Thread(target = produce, daemon = True)
+    thread.start()
+    try:
+        while True:
+            item = items.get()
+            if item is done:
+                break
+            yield item
+    finally:
+        stop.set()
+        thread.join()
+    if len(errors) > 0:
+        raise errors[0]
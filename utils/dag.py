@@ -0,0 +1,128 @@
+import threading
+import time
+import traceback
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+class Dag(object):
+    """Run tasks in threads as soon as the tasks they depend on are done
+
+    Every task is called with the results of its dependencies, in the order of the dependencies. A task is skipped
+    when one of its dependencies fails, but only waits for the tasks it runs after, whether they succeed or not.
+    Tasks are added in topological order: the dependencies of a task must be added before it.
+
+    Usage:
+        dag = Dag()
+        dag.add('probe', probe)
+        dag.add('load', lambda dates: load(dates), ['probe'])
+        dag.run()
+        dag.print_report()
+    """
+    def __init__(self):
+        self._tasks = {}
+        self._lock = threading.Lock()
+        self.results = {}
+        self.errors = {}
+        self.timings = {}
+        self.skipped = []
+
+    def add(self, name : str, function, dependencies : list = (), after : list = ()):
+        """
+        Args:
+            name (str): name of the task
+            function (callable): called with the results of dependencies
+            dependencies (list, optional): tasks whose results are needed. Defaults to ().
+            after (list, optional): tasks to wait for, even if they fail; their results are not passed. Defaults to ().
+        """
+        if name in self._tasks:
+            raise ValueError(f"Task {name} is already in the DAG")
+        unknown = [dependency for dependency in list(dependencies) + list(after) if dependency not in self._tasks]
+        if len(unknown) > 0:
+            raise ValueError(f"Task {name} depends on unknown tasks {unknown}")
+        self._tasks[name] = (function, list(dependencies), list(after))
+
+    def _finished(self, name) -> bool:
+        return name in self.results or name in self.errors or name in self.skipped
+
+    def _run_task(self, name, start_time):
+        function, dependencies, _ = self._tasks[name]
+        start = time.perf_counter()
+        try:
+            return function(*[self.results[dependency] for dependency in dependencies])
+        finally:
+            with self._lock:
+                self.timings[name] = (start - start_time, time.perf_counter() - start_time)
+
+    def run(self, max_workers : int = None) -> dict:
+        """Run every task, skipping the tasks whose dependencies failed
+
+        Args:
+            max_workers (int, optional): number of tasks running at once. Defaults to the number of tasks.
+
+        Raises:
+            RuntimeError: when a task failed, after every other task is done
+
+        Returns:
+            dict: result of every task
+        """
+        start_time = time.perf_counter()
+        pending = dict(self._tasks)
+        running = {}
+        with ThreadPoolExecutor(max_workers = max_workers or max(1, len(self._tasks))) as executor:
+            while len(pending) > 0 or len(running) > 0:
+                for name, (_, dependencies, after) in list(pending.items()):
+                    if any(dependency in self.errors or dependency in self.skipped for dependency in dependencies):
+                        print(f"Skipping {name}: a dependency failed")
+                        self.skipped.append(name)
+                        del pending[name]
+                    elif all(dependency in self.results for dependency in dependencies) and all(self._finished(task) for task in after):
+                        running[executor.submit(self._run_task, name, start_time)] = name
+                        del pending[name]
+                if len(running) == 0:
+                    continue
+                done, _ = wait(running, return_when = FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    try:
+                        self.results[name] = future.result()
+                    except Exception as e:
+                        print(f"Task {name} failed")
+                        print(traceback.format_exc())
+                        self.errors[name] = e
+        if len(self.errors) > 0:
+            raise RuntimeError(f"Failed tasks: {', '.join(self.errors)}. Skipped tasks: {', '.join(self.skipped) or 'none'}")
+        return self.results
+
+    def critical_path(self) -> tuple:
+        """Chain of dependent tasks with the longest total duration, i.e. the one bounding the run time
+
+        Returns:
+            tuple: (list of task names, total seconds)
+        """
+        lengths, previous = {}, {}
+        # tasks are stored in topological order
+        for name, (_, dependencies, after) in self._tasks.items():
+            if name not in self.timings:
+                continue
+            start, end = self.timings[name]
+            done = [dependency for dependency in dependencies + after if dependency in lengths]
+            previous[name] = max(done, key = lambda dependency: lengths[dependency]) if len(done) > 0 else None
+            lengths[name] = end - start + (lengths[previous[name]] if previous[name] is not None else 0.0)
+        if len(lengths) == 0:
+            return [], 0.0
+        name = max(lengths, key = lambda task: lengths[task])
+        total = lengths[name]
+        path = []
+        while name is not None:
+            path.append(name)
+            name = previous[name]
+        return path[::-1], total
+
+    def print_report(self):
+        for name, (start, end) in sorted(self.timings.items(), key = lambda item: item[1][0]):
+            status = 'failed' if name in self.errors else 'done'
+            print(f"{name:<24} {status:<7} start {start:>8.2f}s  duration {end - start:>8.2f}s")
+        for name in self.skipped:
+            print(f"{name:<24} skipped")
+        path, total = self.critical_path()
+        if len(path) > 0:
+            print(f"Critical path ({total:.2f}s): {' -> '.join(path)}")
@@ -0,0 +1,175 @@
+import hashlib
+import json
+import os
+import threading
+import time
+import urllib.request
+from urllib.error import HTTPError, URLError
+
+class DownloadCache(object):
+    """Persistent cache of downloaded archives
+
+    Archives are stored once per content hash under <root>/objects, and <root>/index.json maps every url to
+    its hash and the validators returned by the server (ETag, Last-Modified). Whether an archive has been loaded
+    is recorded in the ingestion_coverage table, next to the rows themselves.
+    Cached urls are revalidated with a conditional request, so an unchanged archive costs one 304 response.
+    """
+    INDEX_FILE = 'index.json'
+    OBJECT_FOLDER = 'objects'
+    def __init__(self, root : str, max_size : int = 1024 * 1024 * 1024):
+        """
+        Args:
+            root (str): cache folder
+            max_size (int, optional): maximum total size of the stored archives in bytes. Defaults to 1GB.
+        """
+        self.root = root
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        os.makedirs(os.path.join(self.root, DownloadCache.OBJECT_FOLDER), exist_ok = True)
+        self._index_path = os.path.join(self.root, DownloadCache.INDEX_FILE)
+        if os.path.exists(self._index_path):
+            with open(self._index_path) as f:
+                self._index = json.load(f)
+        else:
+            self._index = {}
+
+    def _object_path(self, digest):
+        return os.path.join(self.root, DownloadCache.OBJECT_FOLDER, f'{digest}.zip')
+
+    def _save_index(self):
+        # write then rename, so that a crash never leaves a truncated index
+        tmp_path = f'{self._index_path}.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(self._index, f)
+        os.replace(tmp_path, self._index_path)
+
+    def _read_object(self, digest):
+        path = self._object_path(digest)
+        if not os.path.exists(path):
+            return None
+        with open(path, 'rb') as f:
+            return f.read()
+
+    def _write_object(self, digest, content):
+        path = self._object_path(digest)
+        if not os.path.exists(path):
+            tmp_path = f'{path}.tmp'
+            with open(tmp_path, 'wb') as f:
+                f.write(content)
+            os.replace(tmp_path, path)
+
+    def _evict(self):
+        """Remove the least recently used archives until the cache fits in max_size
+        """
+        # several urls may share one object
+        objects = {}
+        for entry in self._index.values():
+            digest = entry.get('hash')
+            if digest is not None:
+                objects[digest] = max(objects.get(digest, 0), entry['accessed'])
+        total = sum(os.path.getsize(self._object_path(d)) for d in objects if os.path.exists(self._object_path(d)))
+        for digest, _ in sorted(objects.items(), key = lambda item: item[1]):
+            if total <= self.max_size:
+                break
+            path = self._object_path(digest)
+            if os.path.exists(path):
+                total -= os.path.getsize(path)
+                os.remove(path)
+            for entry in self._index.values():
+                if entry.get('hash') == digest:
+                    entry['hash'] = None
+                    entry.pop('etag', None)
+                    entry.pop('last_modified', None)
+
+    def lookup(self, url : str):
+        """Cached content of url and the headers of a conditional request revalidating it
+
+        Returns:
+            tuple: (content, headers), (None, {}) when url is not cached
+        """
+        with self._lock:
+            entry = dict(self._index.get(url, {}))
+        cached = self._read_object(entry['hash']) if entry.get('hash') else None
+        headers = {}
+        if cached is not None:
+            if entry.get('etag'):
+                headers['If-None-Match'] = entry['etag']
+            if entry.get('last_modified'):
+                headers['If-Modified-Since'] = entry['last_modified']
+        return cached, headers
+
+    def fetch(self, url : str):
+        """Download url, or reuse the cached copy when the server reports it unchanged
+
+        Args:
+            url (str): archive url
+
+        Returns:
+            tuple: (content, sha256 hex digest), None if the server answers 404
+        """
+        cached, headers = self.lookup(url)
+        request = urllib.request.Request(url, headers = headers)
+        try:
+            with urllib.request.urlopen(request) as dl_file:
+                content = dl_file.read()
+                headers = dl_file.headers
+        except HTTPError as err:
+            if err.code == 304 and cached is not None:
+                print(f"{url} not modified, using cached archive")
+                content = cached
+                headers = None
+            elif err.code == 404:
+                return None
+            else:
+                raise URLError(f"Encountered HTTP error: {err.code}")
+        return content, self.store(url, content, headers)
+
+    def store(self, url : str, content : bytes, headers = None) -> str:
+        """Add downloaded content to the cache
+
+        Args:
+            url (str): archive url
+            content (bytes): archive
+            headers (optional): response headers holding the new ETag and Last-Modified validators.
+                Defaults to None, which keeps the current validators (e.g. after a 304).
+
+        Returns:
+            str: sha256 hex digest of content
+        """
+        digest = content_digest(content)
+        with self._lock:
+            entry = self._index.setdefault(url, {})
+            if headers is not None:
+                entry['etag'] = headers.get('ETag')
+                entry['last_modified'] = headers.get('Last-Modified')
+            entry['hash'] = digest
+            entry['accessed'] = time.time()
+            self._write_object(digest, content)
+            self._evict()
+            self._save_index()
+        return digest
+
+def content_digest(content : bytes) -> str:
+    """Hash identifying an archive in the cache and in ingestion_coverage
+    """
+    return hashlib.sha256(content).hexdigest()
+
+def is_published(url : str, timeout : float = 10) -> bool:
+    """Check whether url exists without downloading it
+
+    Sends a HEAD request, and falls back to a one byte range request for servers that reject HEAD.
+
+    Returns:
+        bool: False if the server answers 404
+    """
+    for method, headers in [('HEAD', {}), ('GET', {'Range' : 'bytes=0-0'})]:
+        request = urllib.request.Request(url, method = method, headers = headers)
+        try:
+            with urllib.request.urlopen(request, timeout = timeout):
+                return True
+        except HTTPError as err:
+            if err.code == 404:
+                return False
+            if err.code not in (403, 405, 501):
+                raise URLError(f"Encountered HTTP error: {err.code}")
+    raise URLError(f"Could not probe {url}")
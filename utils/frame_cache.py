@@ -0,0 +1,176 @@
+import threading
+import time
+from collections import OrderedDict
+
+import pandas as pd
+
+from utils import prices
+from utils.prices import OHLCV_COLUMNS
+from utils.utilities import get_engine
+
+class FrameCache(object):
+    """In-process LRU cache of the price frames returned by utils.prices.read_prices
+
+    Entries are keyed by (stock code, column set, date range). A request is served from any entry of the same stock
+    code whose columns and date range contain it, so the analysis functions called one after the other on a stock
+    code share one query. Misses load date and OHLCV_COLUMNS whatever the requested columns, so the next function
+    asking for other prices of the same range also hits.
+
+    The entries of a stock code are dropped when the ingestion watermark of a stock exchange holding its rows, the
+    last complete load recorded in ingestion_coverage, moves forward. The watermarks are read at most once every
+    check_interval seconds.
+
+    Usage:
+        from utils.frame_cache import enable_frame_cache
+        cache = enable_frame_cache(max_bytes = 256 * 1024 * 1024)
+        ...
+        cache.print_stats()
+    """
+    COLUMNS = ['date'] + OHLCV_COLUMNS
+    def __init__(self, max_bytes : int = 256 * 1024 * 1024, check_interval : float = 60.0, engine = None):
+        self.max_bytes = max_bytes
+        self.check_interval = check_interval
+        self.engine = engine if engine is not None else get_engine()
+        self._lock = threading.Lock()
+        # (stock_code, columns, start_date, end_date) -> (frame, partitions, nbytes), least recently used first
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._watermarks = None
+        self._checked_at = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def _check_watermarks(self):
+        """Drop the entries of the stock exchanges loaded since the last check
+        """
+        now = time.monotonic()
+        if self._checked_at is not None and now - self._checked_at < self.check_interval:
+            return
+        watermarks = prices.ingestion_watermarks(engine = self.engine)
+        with self._lock:
+            self._checked_at = now
+            if self._watermarks is not None:
+                moved = {feed for feed, watermark in watermarks.items() if self._watermarks.get(feed) != watermark}
+                for key in [key for key, entry in self._entries.items() if len(moved & set(entry[1])) > 0]:
+                    self._remove(key)
+                    self.invalidations += 1
+            self._watermarks = watermarks
+
+    def _remove(self, key):
+        _, _, nbytes = self._entries.pop(key)
+        self._bytes -= nbytes
+
+    @staticmethod
+    def _covers(key, columns, start_date, end_date) -> bool:
+        _, entry_columns, entry_start, entry_end = key
+        if not set(columns) <= set(entry_columns):
+            return False
+        if (entry_start, entry_end) == (start_date, end_date):
+            return True
+        # None is an open bound
+        return (entry_start is None or (start_date is not None and entry_start <= start_date)) and \
+            (entry_end is None or (end_date is not None and end_date <= entry_end))
+
+    @staticmethod
+    def _slice(frame, stock_code, columns, start_date, end_date) -> pd.DataFrame:
+        dates = pd.to_datetime(frame['date'])
+        mask = pd.Series(True, index = frame.index)
+        if start_date is not None:
+            mask &= dates >= pd.Timestamp(start_date)
+        if end_date is not None:
+            mask &= dates <= pd.Timestamp(end_date)
+        # a copy, the analysis functions add columns to the frames they read
+        df = frame.loc[mask, [column for column in columns if column != 'stock_code']].reset_index(drop = True)
+        if 'stock_code' in columns:
+            df.insert(0, 'stock_code', stock_code)
+        return df[list(columns)]
+
+    def _lookup(self, stock_code, columns, start_date, end_date):
+        with self._lock:
+            for key in reversed(self._entries):
+                if key[0] == stock_code and FrameCache._covers(key, columns, start_date, end_date):
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return self._entries[key][0]
+            self.misses += 1
+        return None
+
+    def _store(self, key, frame, partitions):
+        nbytes = int(frame.memory_usage(deep = True).sum())
+        if nbytes > self.max_bytes:
+            return
+        with self._lock:
+            # entries contained in the new one are never looked up again
+            for old_key in [old_key for old_key in self._entries if old_key[0] == key[0] and FrameCache._covers(key, old_key[1], old_key[2], old_key[3])]:
+                self._remove(old_key)
+            self._entries[key] = (frame, partitions, nbytes)
+            self._bytes += nbytes
+            while self._bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def get(self, stock_code : str, columns : list, start_date, end_date, loader) -> pd.DataFrame:
+        """Prices of one stock code from the cache, loaded with loader on a miss
+
+        Args:
+            stock_code (str): stock code
+            columns (list): transaction columns
+            start_date (datetime.date): first date, included, None for the whole history
+            end_date (datetime.date): last date, included, None for the last loaded date
+            loader (function): loader(stock_code, columns, start_date, end_date) -> pd.DataFrame ordered by date
+
+        Returns:
+            pd.DataFrame: one row per date
+        """
+        columns = list(columns)
+        if any(column not in FrameCache.COLUMNS + ['stock_code'] for column in columns):
+            return loader(stock_code, columns, start_date, end_date)
+        self._check_watermarks()
+        frame = self._lookup(stock_code, columns, start_date, end_date)
+        if frame is None:
+            frame = loader(stock_code, FrameCache.COLUMNS, start_date, end_date)
+            partitions = prices.listing_info([stock_code], self.engine)[stock_code]['partitions']
+            self._store((stock_code, tuple(FrameCache.COLUMNS), start_date, end_date), frame, partitions)
+        return FrameCache._slice(frame, stock_code, columns, start_date, end_date)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries' : len(self._entries),
+                'bytes' : self._bytes,
+                'max_bytes' : self.max_bytes,
+                'hits' : self.hits,
+                'misses' : self.misses,
+                'hit_rate' : self.hits / lookups if lookups > 0 else 0.0,
+                'evictions' : self.evictions,
+                'invalidations' : self.invalidations
+            }
+
+    def print_stats(self):
+        stats = self.stats()
+        print(f"Frame cache: {stats['entries']} entries, {stats['bytes'] / 1024 / 1024:.1f}/{stats['max_bytes'] / 1024 / 1024:.1f} MB, "
+            f"{stats['hits']} hits, {stats['misses']} misses ({stats['hit_rate']:.1%} hit rate), "
+            f"{stats['evictions']} evictions, {stats['invalidations']} invalidations")
+
+def enable_frame_cache(max_bytes : int = 256 * 1024 * 1024, check_interval : float = 60.0, engine = None) -> FrameCache:
+    """Serve utils.prices.read_prices from a FrameCache
+
+    Args:
+        max_bytes (int, optional): memory held by the cached frames. Defaults to 256 MB.
+        check_interval (float, optional): seconds between two reads of the ingestion watermarks. Defaults to 60.
+        engine (optional): SQLAlchemy engine. Defaults to the shared engine.
+
+    Returns:
+        FrameCache: the enabled cache
+    """
+    cache = FrameCache(max_bytes, check_interval, engine)
+    prices.set_frame_cache(cache)
+    return cache
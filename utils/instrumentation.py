@@ -0,0 +1,136 @@
+import json
+import os
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from datetime import datetime
+
+class RunReport(object):
+    """Per-stage timings and row counters of one ingestion run
+
+    Timings and counters are kept per feed (stock exchange or index) and are safe to update from several threads.
+    """
+    STAGES = ['download', 'unzip', 'parse', 'diff', 'load']
+    def __init__(self, name : str = 'daily_transaction'):
+        self.name = name
+        self.started_at = datetime.now()
+        self._lock = threading.Lock()
+        self._seconds = defaultdict(lambda: defaultdict(float))
+        self._counters = defaultdict(lambda: defaultdict(int))
+
+    def add_time(self, stage : str, feed : str, seconds : float):
+        with self._lock:
+            self._seconds[feed][stage] += seconds
+
+    def count(self, feed : str, counter : str, value : int = 1):
+        with self._lock:
+            self._counters[feed][counter] += int(value)
+
+    @contextmanager
+    def stage(self, stage : str, feed : str = 'all'):
+        """Time the body of a with block as stage of feed
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(stage, feed, time.perf_counter() - start)
+
+    def timed_iter(self, stage : str, feed : str, iterable):
+        """Yield the items of iterable, timing how long each one takes to produce
+        """
+        iterator = iter(iterable)
+        while True:
+            start = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                self.add_time(stage, feed, time.perf_counter() - start)
+                return
+            self.add_time(stage, feed, time.perf_counter() - start)
+            yield item
+
+    def summary(self) -> dict:
+        """Timings, counters and load throughput of every feed
+        """
+        with self._lock:
+            feeds = {}
+            for feed in sorted(set(self._seconds) | set(self._counters)):
+                seconds = dict(self._seconds[feed])
+                counters = dict(self._counters[feed])
+                load_seconds = seconds.get('load', 0.0)
+                feeds[feed] = {
+                    'seconds' : seconds,
+                    'counters' : counters,
+                    'rows_per_second' : counters.get('rows_loaded', 0) / load_seconds if load_seconds > 0 else None
+                }
+        return {
+            'name' : self.name,
+            'started_at' : self.started_at.isoformat(),
+            'finished_at' : datetime.now().isoformat(),
+            'feeds' : feeds
+        }
+
+    def print_summary(self):
+        for feed, values in self.summary()['feeds'].items():
+            timings = ', '.join(f"{stage} {values['seconds'][stage]:.2f}s" for stage in RunReport.STAGES if stage in values['seconds'])
+            counters = ', '.join(f"{counter} {value}" for counter, value in sorted(values['counters'].items()))
+            rate = f", {values['rows_per_second']:.0f} rows/s" if values['rows_per_second'] is not None else ''
+            print(f"{feed}: {timings} | {counters}{rate}")
+
+    def write_json(self, path : str):
+        with open(path, 'w') as f:
+            json.dump(self.summary(), f, indent = 2)
+
+    def write_prometheus(self, path : str):
+        """Write the report in the Prometheus textfile collector format
+        """
+        lines = [
+            f'# HELP {self.name}_stage_seconds Time spent in each ingestion stage',
+            f'# TYPE {self.name}_stage_seconds gauge'
+        ]
+        summary = self.summary()
+        for feed, values in summary['feeds'].items():
+            for stage, seconds in values['seconds'].items():
+                lines.append(f'{self.name}_stage_seconds{{feed="{feed}",stage="{stage}"}} {seconds:.6f}')
+        lines += [
+            f'# HELP {self.name}_rows Rows handled by the ingestion, by outcome',
+            f'# TYPE {self.name}_rows gauge'
+        ]
+        for feed, values in summary['feeds'].items():
+            for counter, value in values['counters'].items():
+                lines.append(f'{self.name}_rows{{feed="{feed}",outcome="{counter}"}} {value}')
+        lines += [
+            f'# HELP {self.name}_rows_per_second Load throughput',
+            f'# TYPE {self.name}_rows_per_second gauge'
+        ]
+        for feed, values in summary['feeds'].items():
+            if values['rows_per_second'] is not None:
+                lines.append(f'{self.name}_rows_per_second{{feed="{feed}"}} {values["rows_per_second"]:.3f}')
+        # the textfile collector may read at any time, so write then rename
+        tmp_path = f'{path}.tmp'
+        with open(tmp_path, 'w') as f:
+            f.write('\n'.join(lines) + '\n')
+        os.replace(tmp_path, path)
+
+class ProgressLogger(object):
+    """Print progress every `every` rows or `interval` seconds instead of on every row
+    """
+    def __init__(self, label : str, total : int = None, every : int = 10000, interval : float = 5.0):
+        self.label = label
+        self.total = total
+        self.every = every
+        self.interval = interval
+        self.rows = 0
+        self._last_rows = 0
+        self._last_time = time.perf_counter()
+
+    def update(self, rows : int = 1):
+        self.rows += rows
+        now = time.perf_counter()
+        if self.rows - self._last_rows >= self.every or now - self._last_time >= self.interval:
+            total = f"/{self.total}" if self.total is not None else ''
+            print(f"{self.label}: {self.rows}{total} rows updated")
+            self._last_rows = self.rows
+            self._last_time = now
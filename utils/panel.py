@@ -0,0 +1,117 @@
+import numpy as np
+import pandas as pd
+
+from utils.prices import CHUNK_SIZE, iter_price_arrays
+
+ALIGNMENTS = ['inner', 'ffill', 'mask']
+
+class PricePanel(object):
+    """Prices of several stock codes aligned on dates: values[i, j] is the price of stock_codes[j] on dates[i]
+
+    values is a NumPy array, or a memory-mapped .npy file when the panel was built with a path.
+    """
+    def __init__(self, dates : np.ndarray, stock_codes : list, values : np.ndarray):
+        self.dates = dates
+        self.stock_codes = stock_codes
+        self.values = values
+
+    @property
+    def mask(self) -> np.ndarray:
+        """True where a stock code has a price
+        """
+        return ~np.isnan(self.values)
+
+    def to_frame(self) -> pd.DataFrame:
+        """The panel as a DataFrame indexed by date with one column per stock code, sharing the values
+        """
+        return pd.DataFrame(self.values, index = pd.DatetimeIndex(self.dates, name = 'date'), columns = self.stock_codes, copy = False)
+
+def _forward_fill(values : np.ndarray):
+    # column by column, so that a memory-mapped panel is never loaded at once
+    rows = np.arange(values.shape[0])
+    for j in range(values.shape[1]):
+        column = values[:, j]
+        last_valid = np.where(np.isnan(column), 0, rows)
+        np.maximum.accumulate(last_valid, out = last_valid)
+        values[:, j] = column[last_valid]
+
+def build_panel(series, stock_codes : list, align : str = 'inner', dtype : str = 'float32', path : str = None) -> PricePanel:
+    """Align the price series of stock codes on their dates in one pass, without merging frames
+
+    Args:
+        series (iterable): (stock_code, dates, prices) of every stock code, dates sorted and unique
+        stock_codes (list): stock codes, in the order of the columns
+        align (str, optional): inner keeps the dates where every stock code has a price, ffill keeps every date and
+            carries the last price forward, mask keeps every date with NaN for the missing prices. Defaults to 'inner'.
+        dtype (str, optional): dtype of the values. Defaults to 'float32'.
+        path (str, optional): .npy file backing the values with memory mapping. Defaults to None.
+
+    Raises:
+        ValueError: when align is unknown
+
+    Returns:
+        PricePanel: the aligned prices
+    """
+    if align not in ALIGNMENTS:
+        raise ValueError(f"Unknown alignment {align}, expected one of {ALIGNMENTS}")
+    stock_codes = list(dict.fromkeys(stock_codes))
+    columns = {stock_code : j for j, stock_code in enumerate(stock_codes)}
+    dates, prices = {}, {}
+    for stock_code, stock_dates, stock_prices in series:
+        stock_prices = np.asarray(stock_prices, dtype = dtype)
+        # a NULL price is a missing price
+        valid = ~np.isnan(stock_prices)
+        dates[stock_code] = np.asarray(stock_dates, dtype = 'datetime64[D]')[valid]
+        prices[stock_code] = stock_prices[valid]
+
+    all_dates = np.unique(np.concatenate(list(dates.values()))) if len(dates) > 0 else np.array([], dtype = 'datetime64[D]')
+    rows = {stock_code : np.searchsorted(all_dates, stock_dates) for stock_code, stock_dates in dates.items()}
+    if align == 'inner':
+        counts = np.zeros(len(all_dates), dtype = 'int64')
+        for stock_row in rows.values():
+            counts[stock_row] += 1
+        kept = counts == len(stock_codes)
+        new_rows = np.cumsum(kept) - 1
+        for stock_code, stock_row in rows.items():
+            stock_kept = kept[stock_row]
+            rows[stock_code] = new_rows[stock_row[stock_kept]]
+            prices[stock_code] = prices[stock_code][stock_kept]
+        all_dates = all_dates[kept]
+
+    shape = (len(all_dates), len(stock_codes))
+    if path is not None:
+        values = np.lib.format.open_memmap(path, mode = 'w+', dtype = dtype, shape = shape)
+    else:
+        values = np.empty(shape, dtype = dtype)
+    values[:] = np.nan
+    for stock_code, stock_row in rows.items():
+        values[stock_row, columns[stock_code]] = prices[stock_code]
+    if align == 'ffill':
+        _forward_fill(values)
+    if path is not None:
+        values.flush()
+    return PricePanel(all_dates, stock_codes, values)
+
+def close_panel(stock_codes : list, start_date = None, end_date = None, align : str = 'inner', dtype : str = 'float32',
+        path : str = None, column : str = 'close_price', chunksize : int = CHUNK_SIZE, engine = None) -> PricePanel:
+    """Dates x stock codes matrix of close prices, streamed from the transaction table in one query
+
+    Args:
+        stock_codes (list): stock codes, in the order of the columns
+        start_date (datetime.date, optional): first date, included. Defaults to None.
+        end_date (datetime.date, optional): last date, included. Defaults to None.
+        align (str, optional): inner, ffill or mask, see build_panel. Defaults to 'inner'.
+        dtype (str, optional): dtype of the values. Defaults to 'float32'.
+        path (str, optional): .npy file backing the values, reopened with np.load(path, mmap_mode = 'r'). Defaults to None.
+        column (str, optional): price column. Defaults to 'close_price'.
+        chunksize (int, optional): rows per fetch of the cursor. Defaults to CHUNK_SIZE.
+        engine (optional): SQLAlchemy engine. Defaults to the shared engine.
+
+    Returns:
+        PricePanel: the aligned prices
+    """
+    series = (
+        (stock_code, pd.to_datetime(arrays['date']).values.astype('datetime64[D]'), pd.to_numeric(arrays[column]))
+        for stock_code, arrays in iter_price_arrays(stock_codes, ['date', column], start_date, end_date, chunksize, engine)
+    )
+    return build_panel(series, stock_codes, align, dtype, path)
@@ -0,0 +1,257 @@
+import json
+import os
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import text
+
+from utils import prices
+from utils.prices import OHLCV_COLUMNS, iter_price_arrays
+from utils.utilities import get_engine
+
+try:
+    import pyarrow as pa
+except ImportError:
+    pa = None
+
+def _watermark(last_date, updated_at) -> list:
+    # JSON form of a watermark of utils.prices.ingestion_watermarks
+    return [pd.Timestamp(last_date).date().isoformat(), pd.Timestamp(updated_at).isoformat()]
+
+class PriceCache(object):
+    """On-disk columnar copy of the transaction and stock_index tables, one Arrow IPC file per ticker
+
+    Files are laid out as <root>/transaction/<stock exchange>/<stock code>.arrow and <root>/stock_index/<index>.arrow,
+    uncompressed so that they are read with memory mapping.
+
+    The manifest keeps the ingestion watermark of every feed at the last refresh. refresh() re-reads the rows from the
+    first date of the loads completed since then, so backfilled days are picked up too, and the whole history of
+    stock codes without a file yet (e.g. replayed from quarantine). read() only serves stock codes whose feeds have
+    not been loaded since the last refresh, otherwise it returns None and the callers read Postgres, unless
+    auto_refresh is set. Feeds without any ingestion_coverage row cannot be tracked and are read in full by refresh().
+
+    pyarrow is optional: without it the cache stays empty and read() returns None, so callers use Postgres.
+    """
+    ROOT_PATH = os.path.join('.cache', 'prices')
+    COLUMNS = ['date'] + OHLCV_COLUMNS
+    def __init__(self, root : str = ROOT_PATH, engine = None, auto_refresh : bool = False, check_interval : float = 60.0):
+        self.root = root
+        self.engine = engine if engine is not None else get_engine()
+        self.available = pa is not None
+        self.auto_refresh = auto_refresh
+        self.check_interval = check_interval
+        self._lock = threading.RLock()
+        self._manifest_path = os.path.join(root, 'manifest.json')
+        self._manifest = self._load_manifest()
+        self._watermarks = None
+        self._checked_at = None
+
+    def _load_manifest(self):
+        if os.path.exists(self._manifest_path):
+            with open(self._manifest_path) as f:
+                return json.load(f)
+        return {'transaction' : {}, 'stock_index' : {}}
+
+    def _save_manifest(self):
+        os.makedirs(self.root, exist_ok = True)
+        tmp_path = f'{self._manifest_path}.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(self._manifest, f, indent = 2)
+        os.replace(tmp_path, self._manifest_path)
+
+    def _path(self, table, key, feed = None):
+        if table == 'transaction':
+            return os.path.join(self.root, table, feed, f'{key}.arrow')
+        return os.path.join(self.root, table, f'{key}.arrow')
+
+    def _read_table(self, path):
+        with pa.memory_map(path, 'r') as source:
+            return pa.ipc.open_file(source).read_all()
+
+    def _write(self, path, arrays : dict, since = None):
+        """Replace the rows of the file at path from since onwards (all of them when since is None) by arrays
+        """
+        new_rows = pa.table({
+            'date' : pa.array(pd.to_datetime(arrays['date']).values.astype('datetime64[D]'), type = pa.date32()),
+            **{column : pa.array(np.asarray(arrays[column], dtype = 'float64')) for column in OHLCV_COLUMNS if column != 'volume'},
+            # nullable, like the bigint column
+            'volume' : pa.array(pd.array(arrays['volume'], dtype = 'Int64'))
+        })
+        if since is not None and os.path.exists(path):
+            cached = self._read_table(path)
+            kept = np.searchsorted(cached.column('date').to_numpy().astype('datetime64[D]'), np.datetime64(since, 'D'))
+            new_rows = pa.concat_tables([cached.slice(0, kept), new_rows])
+        os.makedirs(os.path.dirname(path), exist_ok = True)
+        tmp_path = f'{path}.tmp'
+        with pa.OSFile(tmp_path, 'wb') as sink:
+            with pa.ipc.new_file(sink, new_rows.schema) as writer:
+                writer.write_table(new_rows)
+        os.replace(tmp_path, path)
+
+    def _changed_since(self, table, feeds) -> dict:
+        """First date to re-read for every feed, from the loads completed since the last refresh
+
+        Returns:
+            dict: {feed : datetime.date}, None for a feed to read in full, no entry for an unchanged feed
+        """
+        coverage = pd.read_sql_query(text("""
+            SELECT feed, first_date, updated_at
+            FROM public.ingestion_coverage
+            WHERE complete AND feed = ANY(:feeds)"""),
+            self.engine, params = {'feeds' : list(feeds)})
+        changed = {}
+        for feed in feeds:
+            cached = self._manifest[table].get(feed)
+            loads = coverage[coverage['feed'] == feed]
+            if not isinstance(cached, list) or len(loads) == 0:
+                changed[feed] = None
+                continue
+            new_loads = loads[pd.to_datetime(loads['updated_at']) > pd.Timestamp(cached[1])]
+            if len(new_loads) > 0:
+                changed[feed] = pd.Timestamp(new_loads['first_date'].min()).date()
+        return changed
+
+    def _record_watermarks(self, table, feeds, watermarks):
+        for feed in feeds:
+            if feed in watermarks:
+                self._manifest[table][feed] = _watermark(*watermarks[feed])
+            else:
+                self._manifest[table].pop(feed, None)
+
+    def _refresh_transactions(self, stock_exchanges, watermarks):
+        codes = pd.read_sql_query(text("""
+            SELECT stock_code, stock_exchange::text AS stock_exchange
+            FROM public.stock_info
+            WHERE stock_exchange::text = ANY(:stock_exchanges)"""),
+            self.engine, params = {'stock_exchanges' : list(stock_exchanges)})
+        listings = prices.listing_info(codes['stock_code'].tolist(), self.engine)
+        feeds = sorted({partition for listing in listings.values() for partition in listing['partitions']} | set(stock_exchanges))
+        changed = self._changed_since('transaction', feeds)
+        # stock codes grouped by the first date to re-read, None for the whole history
+        batches = {}
+        for stock_code, listing in listings.items():
+            path = self._path('transaction', stock_code, listing['stock_exchange'])
+            partitions = [partition for partition in listing['partitions'] if partition in changed]
+            if not os.path.exists(path) or any(changed[partition] is None for partition in partitions):
+                batches.setdefault(None, []).append(stock_code)
+            elif len(partitions) > 0:
+                batches.setdefault(min(changed[partition] for partition in partitions), []).append(stock_code)
+        rows = 0
+        for since, batch_codes in batches.items():
+            for stock_code, arrays in iter_price_arrays(batch_codes, PriceCache.COLUMNS, since, engine = self.engine):
+                self._write(self._path('transaction', stock_code, listings[stock_code]['stock_exchange']), arrays, since)
+                rows += len(arrays['date'])
+        self._record_watermarks('transaction', feeds, watermarks)
+        return rows
+
+    def _refresh_indexes(self, watermarks):
+        stock_indexes = pd.read_sql_query("SELECT DISTINCT stock_index FROM public.stock_index", self.engine)['stock_index'].tolist()
+        changed = self._changed_since('stock_index', stock_indexes)
+        rows = 0
+        for stock_index in stock_indexes:
+            since = changed.get(stock_index, False)
+            if not os.path.exists(self._path('stock_index', stock_index)):
+                since = None
+            if since is False:
+                continue
+            conditions, params = ['stock_index = :stock_index'], {'stock_index' : stock_index}
+            if since is not None:
+                conditions.append('date >= :since')
+                params['since'] = since
+            df = pd.read_sql_query(text(f"""
+                SELECT {', '.join(PriceCache.COLUMNS)}
+                FROM public.stock_index
+                WHERE {' AND '.join(conditions)}
+                ORDER BY date"""),
+                self.engine, params = params)
+            arrays = {column : df[column].to_numpy() for column in PriceCache.COLUMNS}
+            self._write(self._path('stock_index', stock_index), arrays, since)
+            rows += len(df)
+        self._record_watermarks('stock_index', stock_indexes, watermarks)
+        return rows
+
+    def refresh(self, stock_exchanges : list = ('HNX', 'HSX', 'UPCOM')) -> int:
+        """Bring the cache up to the loads recorded in ingestion_coverage
+
+        Returns:
+            int: number of rows written to the cache
+        """
+        if not self.available:
+            print("pyarrow is not installed, the price cache is disabled")
+            return 0
+        with self._lock:
+            # read first, so that loads completing during the refresh are picked up by the next one
+            watermarks = prices.ingestion_watermarks(engine = self.engine)
+            rows = self._refresh_transactions(stock_exchanges, watermarks)
+            self._save_manifest()
+            rows += self._refresh_indexes(watermarks)
+            self._save_manifest()
+            self._watermarks, self._checked_at = watermarks, time.monotonic()
+        print(f"Wrote {rows} rows to the price cache in {self.root}")
+        return rows
+
+    def _is_fresh(self, table, feeds) -> bool:
+        """Whether none of feeds was loaded since the last refresh, reading the watermarks every check_interval
+        """
+        with self._lock:
+            now = time.monotonic()
+            if self._checked_at is None or now - self._checked_at >= self.check_interval:
+                self._watermarks, self._checked_at = prices.ingestion_watermarks(engine = self.engine), now
+            stale = [feed for feed in feeds
+                if (_watermark(*self._watermarks[feed]) if feed in self._watermarks else None) != self._manifest[table].get(feed)]
+            if len(stale) > 0 and self.auto_refresh:
+                self.refresh()
+                return True
+            return len(stale) == 0
+
+    def read(self, stock_code : str, columns : list, start_date = None, end_date = None, table : str = 'transaction') -> pd.DataFrame:
+        """Prices of one stock code (or index) from the cache, ordered by date
+
+        Args:
+            stock_code (str): stock code, or stock index with table = 'stock_index'
+            columns (list): columns among date, OHLCV_COLUMNS and stock_code
+            start_date (datetime.date, optional): first date, included. Defaults to None.
+            end_date (datetime.date, optional): last date, included. Defaults to None.
+            table (str, optional): 'transaction' or 'stock_index'. Defaults to 'transaction'.
+
+        Returns:
+            pd.DataFrame: the prices, or None when the cache cannot serve them or is older than Postgres
+        """
+        if not self.available or any(column not in PriceCache.COLUMNS + ['stock_code'] for column in columns):
+            return None
+        feed, feeds = None, [stock_code]
+        if table == 'transaction':
+            listing = prices.listing_info([stock_code], self.engine)[stock_code]
+            feed, feeds = listing['stock_exchange'], listing['partitions']
+        path = self._path(table, stock_code, feed)
+        if not self._is_fresh(table, feeds) or not os.path.exists(path):
+            return None
+        cached = self._read_table(path)
+        # rows are sorted by date, so the range is a zero-copy slice of the mapped file
+        dates = cached.column('date').to_numpy().astype('datetime64[D]')
+        start = np.searchsorted(dates, np.datetime64(start_date, 'D')) if start_date is not None else 0
+        end = np.searchsorted(dates, np.datetime64(end_date, 'D'), side = 'right') if end_date is not None else len(dates)
+        df = cached.slice(start, end - start).select([column for column in columns if column != 'stock_code']).to_pandas()
+        if 'stock_code' in columns:
+            df.insert(0, 'stock_code', stock_code)
+        return df[list(columns)]
+
+def enable_price_cache(root : str = PriceCache.ROOT_PATH, refresh : bool = True, auto_refresh : bool = False, engine = None) -> PriceCache:
+    """Serve utils.prices.read_prices from a PriceCache, Postgres stays the fallback
+
+    Args:
+        root (str, optional): folder of the cache. Defaults to PriceCache.ROOT_PATH.
+        refresh (bool, optional): refresh the cache first. Defaults to True.
+        auto_refresh (bool, optional): refresh the cache when a new load is found, instead of reading Postgres. Defaults to False.
+        engine (optional): SQLAlchemy engine. Defaults to the shared engine.
+
+    Returns:
+        PriceCache: the enabled cache
+    """
+    cache = PriceCache(root, engine, auto_refresh = auto_refresh)
+    if refresh:
+        cache.refresh()
+    prices.set_price_cache(cache if cache.available else None)
+    return cache
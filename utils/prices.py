@@ -0,0 +1,268 @@
+import threading
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import text
+
+from utils.utilities import get_engine
+
+TRANSACTION_COLUMNS = ['stock_exchange', 'stock_code', 'date', 'open_price', 'highest_price', 'lowest_price', 'close_price', 'volume']
+
+OHLCV_COLUMNS = ['open_price', 'highest_price', 'lowest_price', 'close_price', 'volume']
+CHUNK_SIZE = 100000
+
+_listings = {}
+_listings_lock = threading.Lock()
+# on-disk cache tried before Postgres, see utils.price_cache.enable_price_cache
+_price_cache = None
+
+def set_price_cache(cache):
+    """Serve read_prices and read_prices_many from cache when it has the prices, None to always read Postgres
+    """
+    global _price_cache
+    _price_cache = cache
+
+# in-memory cache tried first, see utils.frame_cache.enable_frame_cache
+_frame_cache = None
+
+def set_frame_cache(cache):
+    """Serve read_prices from cache, None to disable it
+    """
+    global _frame_cache
+    _frame_cache = cache
+
+def listing_info(stock_codes : list, engine = None) -> dict:
+    """Stock exchange, first transaction date and transaction partitions of stock codes, read once per process
+
+    A stock code that moved to another stock exchange keeps its older transactions in the partition of its former
+    stock exchange, so the partitions holding its rows are looked up in the transaction table rather than taken
+    from stock_info. The current stock exchange is always among them, new rows land there.
+
+    Args:
+        stock_codes (list): stock codes
+        engine (optional): SQLAlchemy engine. Defaults to the shared engine.
+
+    Raises:
+        ValueError: when a stock code is not in stock_info
+
+    Returns:
+        dict: {stock_code : {'stock_exchange' : str, 'first_transaction_date' : datetime.date, 'partitions' : list}}
+    """
+    with _listings_lock:
+        missing = sorted(set(stock_codes) - set(_listings))
+    if len(missing) > 0:
+        query = text("""
+            SELECT stock_code, stock_exchange::text AS stock_exchange, first_transaction_date
+            FROM public.stock_info
+            WHERE stock_code = ANY(:stock_codes)""")
+        engine = engine if engine is not None else get_engine()
+        df = pd.read_sql_query(query, engine, params = {'stock_codes' : missing})
+        # one index probe per stock code and partition, each EXISTS is pruned to the partition of its stock exchange
+        partitions = pd.read_sql_query(text("""
+            SELECT c.stock_code, e.stock_exchange::text AS stock_exchange
+            FROM unnest(CAST(:stock_codes AS varchar[])) AS c(stock_code)
+            CROSS JOIN unnest(enum_range(NULL::public.vietnam_stock_exchange)) AS e(stock_exchange)
+            WHERE EXISTS (
+                SELECT 1 FROM public.transaction t
+                WHERE t.stock_exchange = e.stock_exchange AND t.stock_code = c.stock_code)"""),
+            engine, params = {'stock_codes' : list(df['stock_code'])})
+        partitions = partitions.groupby('stock_code')['stock_exchange'].apply(set).to_dict()
+        with _listings_lock:
+            for row in df.itertuples(index = False):
+                _listings[row.stock_code] = {
+                    'stock_exchange' : row.stock_exchange,
+                    'first_transaction_date' : pd.Timestamp(row.first_transaction_date).date(),
+                    'partitions' : sorted(partitions.get(row.stock_code, set()) | {row.stock_exchange})
+                }
+    with _listings_lock:
+        unknown = [stock_code for stock_code in stock_codes if stock_code not in _listings]
+        if len(unknown) > 0:
+            raise ValueError(f"Unknown stock codes {unknown}, run the listing scrapers first")
+        return {stock_code : _listings[stock_code] for stock_code in stock_codes}
+
+def clear_listing_cache(stock_codes : list = None):
+    """Forget the cached listings, e.g. after a sync that moved stock codes to another exchange, see sync_stock_info
+
+    Args:
+        stock_codes (list, optional): stock codes to forget. Defaults to all of them.
+    """
+    with _listings_lock:
+        if stock_codes is None:
+            _listings.clear()
+        for stock_code in stock_codes or []:
+            _listings.pop(stock_code, None)
+
+def ingestion_watermarks(feeds : list = None, engine = None) -> dict:
+    """Last complete load of every feed (stock exchange or stock index) recorded in ingestion_coverage
+
+    A watermark moves when new days are loaded and also when older days are backfilled.
+
+    Args:
+        feeds (list, optional): feeds to read. Defaults to all of them.
+        engine (optional): SQLAlchemy engine. Defaults to the shared engine.
+
+    Returns:
+        dict: {feed : (last_date, updated_at)}
+    """
+    conditions, params = ['complete'], {}
+    if feeds is not None:
+        conditions.append('feed = ANY(:feeds)')
+        params['feeds'] = list(feeds)
+    df = pd.read_sql_query(text(f"""
+        SELECT feed, MAX(last_date) AS last_date, MAX(updated_at) AS updated_at
+        FROM public.ingestion_coverage
+        WHERE {' AND '.join(conditions)}
+        GROUP BY feed"""),
+        engine if engine is not None else get_engine(), params = params)
+    return {row.feed : (pd.Timestamp(row.last_date).date(), pd.Timestamp(row.updated_at)) for row in df.itertuples(index = False)}
+
+def price_query(stock_code : str, stock_exchanges : list, columns : list, start_date = None, end_date = None):
+    """Query of the prices of one stock code, filtered on the partition key
+
+    With stock_exchanges in the WHERE clause, Postgres only scans the partitions holding the stock code (see
+    listing_info), where the (stock_code, date) index serves the date range.
+
+    Returns:
+        tuple: (query, params)
+    """
+    return prices_query([stock_code], stock_exchanges, columns, start_date, end_date)
+
+def read_prices(stock_code : str, columns : list = ('date', 'close_price'), start_date = None, end_date = None, engine = None) -> pd.DataFrame:
+    """Prices of one stock code, ordered by date
+
+    Args:
+        stock_code (str): stock code
+        columns (list, optional): transaction columns. Defaults to ('date', 'close_price').
+        start_date (datetime.date, optional): first date, included. Defaults to None.
+        end_date (datetime.date, optional): last date, included. Defaults to None.
+        engine (optional): SQLAlchemy engine. Defaults to the shared engine.
+
+    Returns:
+        pd.DataFrame: one row per date
+    """
+    engine = engine if engine is not None else get_engine()
+
+    def _load(stock_code, columns, start_date, end_date):
+        if _price_cache is not None:
+            df = _price_cache.read(stock_code, list(columns), start_date, end_date)
+            if df is not None:
+                return df
+        partitions = listing_info([stock_code], engine)[stock_code]['partitions']
+        query, params = price_query(stock_code, partitions, list(columns), start_date, end_date)
+        return pd.read_sql_query(query, engine, params = params)
+
+    if _frame_cache is not None:
+        return _frame_cache.get(stock_code, columns, start_date, end_date, _load)
+    return _load(stock_code, columns, start_date, end_date)
+
+def prices_query(stock_codes : list, stock_exchanges : list, columns : list, start_date = None, end_date = None):
+    """Query of the prices of several stock codes in one round trip, ordered by stock code then date
+
+    Only the partitions of stock_exchanges are scanned, they must include every partition holding the stock codes.
+
+    Returns:
+        tuple: (query, params)
+    """
+    unknown = [column for column in columns if column not in TRANSACTION_COLUMNS]
+    if len(unknown) > 0:
+        raise ValueError(f"Unknown transaction columns {unknown}")
+    # compare the partition key itself, a cast of the column would prevent the partition pruning
+    conditions = ['stock_exchange = ANY(CAST(:stock_exchanges AS public.vietnam_stock_exchange[]))', 'stock_code = ANY(:stock_codes)']
+    params = {'stock_exchanges' : sorted(set(stock_exchanges)), 'stock_codes' : list(stock_codes)}
+    if start_date is not None:
+        conditions.append('date >= :start_date')
+        params['start_date'] = start_date
+    if end_date is not None:
+        conditions.append('date <= :end_date')
+        params['end_date'] = end_date
+    query = text(f"""
+        SELECT {', '.join(columns)}
+        FROM public.transaction
+        WHERE {' AND '.join(conditions)}
+        ORDER BY stock_code, date""")
+    return query, params
+
+def iter_prices(stock_codes : list, columns : list = None, start_date = None, end_date = None,
+        chunksize : int = CHUNK_SIZE, engine = None):
+    """Stream the prices of several stock codes through a server-side cursor, chunksize rows at a time
+
+    Args:
+        stock_codes (list): stock codes
+        columns (list, optional): transaction columns, stock_code is always added. Defaults to date and OHLCV_COLUMNS.
+        start_date (datetime.date, optional): first date, included. Defaults to None.
+        end_date (datetime.date, optional): last date, included. Defaults to None.
+        chunksize (int, optional): rows per chunk. Defaults to CHUNK_SIZE.
+        engine (optional): SQLAlchemy engine. Defaults to the shared engine.
+
+    Yields:
+        pd.DataFrame: chunks of the long frame, ordered by stock code then date
+    """
+    stock_codes = list(dict.fromkeys(stock_codes))
+    if len(stock_codes) == 0:
+        return
+    engine = engine if engine is not None else get_engine()
+    listings = listing_info(stock_codes, engine)
+    columns = ['stock_code'] + [column for column in columns or ['date'] + OHLCV_COLUMNS if column != 'stock_code']
+    partitions = [partition for listing in listings.values() for partition in listing['partitions']]
+    query, params = prices_query(stock_codes, partitions, columns, start_date, end_date)
+    with engine.connect() as connection:
+        # stream_results makes psycopg2 use a named cursor, rows stay on the server until fetched
+        connection = connection.execution_options(stream_results = True, max_row_buffer = chunksize)
+        for chunk in pd.read_sql_query(query, connection, params = params, chunksize = chunksize):
+            yield chunk
+
+def read_prices_many(stock_codes : list, columns : list = None, start_date = None, end_date = None,
+        chunksize : int = CHUNK_SIZE, engine = None) -> pd.DataFrame:
+    """Prices of several stock codes as one long frame, ordered by stock code then date
+
+    Args:
+        see iter_prices
+
+    Returns:
+        pd.DataFrame: one row per stock code and date
+    """
+    columns = ['stock_code'] + [column for column in columns or ['date'] + OHLCV_COLUMNS if column != 'stock_code']
+    if _price_cache is not None:
+        cached = [_price_cache.read(stock_code, columns, start_date, end_date) for stock_code in dict.fromkeys(stock_codes)]
+        if len(cached) > 0 and all(df is not None for df in cached):
+            return pd.concat(cached, ignore_index = True)
+    chunks = list(iter_prices(stock_codes, columns, start_date, end_date, chunksize, engine))
+    if len(chunks) == 0:
+        return pd.DataFrame(columns = columns)
+    return pd.concat(chunks, ignore_index = True)
+
+def iter_price_arrays(stock_codes : list, columns : list = None, start_date = None, end_date = None,
+        chunksize : int = CHUNK_SIZE, engine = None):
+    """Stream the prices of several stock codes as NumPy arrays, one stock code at a time
+
+    Only the history of the current stock code and one chunk are held in memory, so the whole market can be read.
+
+    Args:
+        see iter_prices
+
+    Yields:
+        tuple: (stock_code, {column : np.ndarray})
+    """
+    columns = [column for column in columns or ['date'] + OHLCV_COLUMNS if column != 'stock_code']
+    current, pieces = None, []
+
+    def _arrays():
+        history = pd.concat(pieces, ignore_index = True) if len(pieces) > 1 else pieces[0]
+        return {column : history[column].to_numpy() for column in columns}
+
+    for chunk in iter_prices(stock_codes, columns, start_date, end_date, chunksize, engine):
+        if len(chunk) == 0:
+            continue
+        codes = chunk['stock_code'].to_numpy()
+        # rows are ordered by stock code, so each stock code is a contiguous run
+        starts = np.flatnonzero(np.r_[True, codes[1:] != codes[:-1]])
+        ends = np.r_[starts[1:], len(codes)]
+        for start, end in zip(starts, ends):
+            stock_code = codes[start]
+            if stock_code != current and len(pieces) > 0:
+                yield current, _arrays()
+                pieces = []
+            current = stock_code
+            pieces.append(chunk.iloc[start:end])
+    if len(pieces) > 0:
+        yield current, _arrays()
@@ -0,0 +1,34 @@
+from sqlalchemy import text
+
+def replay_quarantine(engine, schema : str = 'public') -> int:
+    """Move quarantined transactions whose stock code is now listed in stock_info to the transaction table
+
+    Args:
+        engine: SQLAlchemy engine
+        schema (str, optional): schema of the tables. Defaults to 'public'.
+
+    Returns:
+        int: number of replayed rows
+    """
+    with engine.begin() as connection:
+        result = connection.execute(text(f"""
+            INSERT INTO {schema}.transaction
+            SELECT
+                q.stock_exchange,
+                q.stock_code,
+                q.date,
+                q.open_price,
+                q.highest_price,
+                q.lowest_price,
+                q.close_price,
+                q.volume
+            FROM {schema}.transaction_quarantine q
+            JOIN {schema}.stock_info i ON i.stock_code = q.stock_code
+            ON CONFLICT ON CONSTRAINT transaction_unique_key DO NOTHING"""))
+        connection.execute(text(f"""
+            DELETE FROM {schema}.transaction_quarantine q
+            USING {schema}.stock_info i
+            WHERE i.stock_code = q.stock_code"""))
+    if result.rowcount > 0:
+        print(f"Replayed {result.rowcount} quarantined rows")
+    return result.rowcount
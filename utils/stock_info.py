@@ -0,0 +1,110 @@
+import json
+import time
+
+import pandas as pd
+from sqlalchemy import text
+
+from utils.prices import clear_listing_cache
+from utils.utilities import copy_dataframe
+
+STOCK_INFO_COLUMNS = ['company_name', 'free_float', 'first_transaction_date', 'stock_code', 'listing_volume', 'stock_exchange']
+
+def stock_info_hashes(df) -> pd.Series:
+    """Content hash of every listing, indexed by stock code
+
+    Columns are normalized first, so rows scraped from a website and rows read from stock_info hash the same.
+
+    Args:
+        df (pd.DataFrame): listings with STOCK_INFO_COLUMNS
+
+    Returns:
+        pd.Series: uint64 hash per stock code
+    """
+    normalized = pd.DataFrame({
+        'company_name' : df['company_name'].fillna('').astype(str).str.strip(),
+        'free_float' : df['free_float'].astype('int64'),
+        'first_transaction_date' : pd.to_datetime(df['first_transaction_date']).dt.strftime('%Y-%m-%d'),
+        'stock_code' : df['stock_code'].astype(str),
+        'listing_volume' : df['listing_volume'].astype('int64'),
+        'stock_exchange' : df['stock_exchange'].astype(str)
+    })
+    hashes = pd.util.hash_pandas_object(normalized, index = False)
+    hashes.index = normalized['stock_code']
+    return hashes
+
+def sync_stock_info(engine, df, schema : str = 'public', table : str = 'stock_info') -> dict:
+    """Write the listings that are new or changed since the last sync, and report the delisted ones
+
+    The scraped snapshot is diffed against the listings of the same stock exchanges with a per-row content hash,
+    so unchanged listings are not rewritten. The remaining rows are COPYed into a staging table and merged with
+    one INSERT ... ON CONFLICT. Delisted codes are only reported, their transactions still reference them.
+
+    Args:
+        engine: SQLAlchemy engine
+        df (pd.DataFrame): listings with STOCK_INFO_COLUMNS
+        schema (str, optional): schema of the table. Defaults to 'public'.
+        table (str, optional): listing table. Defaults to 'stock_info'.
+
+    Returns:
+        dict: stock codes 'inserted', 'updated' and 'delisted', and the number of 'unchanged' listings
+    """
+    start = time.perf_counter()
+    # a stock code may only appear once in an ON CONFLICT DO UPDATE statement
+    df = df.drop_duplicates(subset = ['stock_code'], keep = 'last')
+    stock_exchanges = [str(stock_exchange) for stock_exchange in sorted(df['stock_exchange'].unique())]
+    with engine.begin() as connection:
+        current = pd.read_sql(text(f"""
+            SELECT {', '.join(STOCK_INFO_COLUMNS)}
+            FROM {schema}.{table}
+            WHERE stock_exchange::text = ANY(:stock_exchanges)"""),
+            connection, params = {'stock_exchanges' : stock_exchanges})
+        scraped_hashes = stock_info_hashes(df)
+        current_hashes = stock_info_hashes(current)
+        # listings that moved from another stock exchange are compared with their stored row too
+        other_codes = sorted(set(scraped_hashes.index) - set(current_hashes.index))
+        if len(other_codes) > 0:
+            moved = pd.read_sql(text(f"""
+                SELECT {', '.join(STOCK_INFO_COLUMNS)}
+                FROM {schema}.{table}
+                WHERE stock_code = ANY(:stock_codes)"""),
+                connection, params = {'stock_codes' : other_codes})
+            current_hashes = pd.concat([current_hashes, stock_info_hashes(moved)])
+        stored = current_hashes.reindex(scraped_hashes.index)
+        inserted = sorted(stored.index[stored.isna()])
+        updated = sorted(stored.index[stored.notna() & (stored != scraped_hashes)])
+        delisted = sorted(set(current['stock_code']) - set(scraped_hashes.index))
+
+        changed = df[df['stock_code'].isin(inserted + updated)]
+        if len(changed) > 0:
+            connection.execute(text(f"""
+                CREATE TEMP TABLE stock_info_staging
+                (LIKE {schema}.{table}) ON COMMIT DROP"""))
+            copy_dataframe(connection, changed, 'stock_info_staging', STOCK_INFO_COLUMNS)
+            connection.execute(text(f"""
+                INSERT INTO {schema}.{table}
+                SELECT s.*
+                FROM stock_info_staging s
+                ON CONFLICT ON CONSTRAINT stock_info_pkey
+                DO UPDATE SET
+                    (company_name, free_float, first_transaction_date, listing_volume, stock_exchange) =
+                    (EXCLUDED.company_name, EXCLUDED.free_float, EXCLUDED.first_transaction_date, EXCLUDED.listing_volume, EXCLUDED.stock_exchange)"""))
+    changes = {
+        'stock_exchanges' : stock_exchanges,
+        'inserted' : inserted,
+        'updated' : updated,
+        'delisted' : delisted,
+        'unchanged' : len(df) - len(changed)
+    }
+    print(f"Synced {schema}.{table} in {time.perf_counter() - start:.2f}s: "
+        f"{len(inserted)} inserted, {len(updated)} updated, {changes['unchanged']} unchanged, {len(delisted)} delisted")
+    if len(delisted) > 0:
+        print(f"Delisted stock codes: {', '.join(delisted)}")
+    # e.g. a stock code that moved exchange has new rows in another partition from now on
+    clear_listing_cache(inserted + updated + delisted)
+    return changes
+
+def write_changes(changes : dict, path : str):
+    """Write the change summary of sync_stock_info as JSON, for the caches keyed by stock code
+    """
+    with open(path, 'w') as f:
+        json.dump(changes, f, indent = 2)
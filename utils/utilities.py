@@ -1,17 +1,235 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
+import numpy as np
+import pandas as pd
 from yaml.loader import SafeLoader
 import yaml
 import os
+import io
+import threading
 
-def get_engine():
-    # Load db_config.yaml
-    with open(os.path.join('conf', 'db_config.yml')) as f:
-        data = yaml.load(f, Loader=SafeLoader)
-    db_connection_url = "postgresql://{}:{}@{}:{}/{}".format(
+CONFIG_PATH = os.path.join('conf', 'db_config.yml')
+ENGINE_DEFAULTS = {
+    'pool_size' : 5,
+    'max_overflow' : 10,
+    'pool_recycle' : 1800,
+    'statement_timeout' : 0
+}
+
+_config = {}
+_engines = {}
+_usages = {}
+_engines_lock = threading.Lock()
+
+class _PoolUsage(object):
+    """Highest number of connections checked out of a pool at once, to size it for the workers
+    """
+    def __init__(self, engine):
+        self.checked_out = 0
+        self.peak = 0
+        self._lock = threading.Lock()
+        event.listen(engine, 'checkout', self._checkout)
+        event.listen(engine, 'checkin', self._checkin)
+
+    def _checkout(self, *args):
+        with self._lock:
+            self.checked_out += 1
+            self.peak = max(self.peak, self.checked_out)
+
+    def _checkin(self, *args):
+        with self._lock:
+            self.checked_out -= 1
+
+def load_config(path : str = CONFIG_PATH) -> dict:
+    """Read a database configuration once per process
+
+    Args:
+        path (str, optional): yaml file with the postgres and engine sections. Defaults to conf/db_config.yml.
+
+    Returns:
+        dict: the parsed configuration, with the engine defaults filled in
+    """
+    with _engines_lock:
+        if path not in _config:
+            with open(path) as f:
+                data = yaml.load(f, Loader=SafeLoader)
+            data['engine'] = {**ENGINE_DEFAULTS, **(data.get('engine') or {})}
+            _config[path] = data
+        return _config[path]
+
+def _database_url(data, driver = 'postgresql'):
+    return "{}://{}:{}@{}:{}/{}".format(
+        driver,
         data['postgres']['username'],
         data['postgres']['password'],
         data['postgres']['host'],
         data['postgres']['port'],
         data['postgres']['db']
     )
-    return create_engine(db_connection_url)
\ No newline at end of file
+
+def _engine_options(data, kwargs):
+    settings = data['engine']
+    options = {
+        'pool_size' : settings['pool_size'],
+        'max_overflow' : settings['max_overflow'],
+        'pool_recycle' : settings['pool_recycle'],
+        # a connection dropped by the server is replaced instead of failing the next query
+        'pool_pre_ping' : True
+    }
+    options.update(kwargs)
+    statement_timeout = options.pop('statement_timeout', settings['statement_timeout'])
+    return options, int(statement_timeout)
+
+def get_engine(**kwargs):
+    """Process-wide engine for conf/db_config.yml, created on the first call
+
+    Calls with the same arguments share one engine and its connection pool, so analysis functions called once per
+    ticker do not pay for the configuration parsing and the connection setup every time.
+
+    Args:
+        kwargs: extra arguments for create_engine, e.g. pool_size, and statement_timeout in milliseconds
+    """
+    key = ('sync', repr(sorted(kwargs.items())))
+    engine = _engines.get(key)
+    if engine is not None:
+        return engine
+    data = load_config()
+    options, statement_timeout = _engine_options(data, kwargs)
+    if statement_timeout > 0:
+        options.setdefault('connect_args', {})['options'] = f'-c statement_timeout={statement_timeout}'
+    with _engines_lock:
+        if key not in _engines:
+            _engines[key] = create_engine(_database_url(data), **options)
+            _usages[key] = _PoolUsage(_engines[key])
+        return _engines[key]
+
+def get_async_engine(**kwargs):
+    """Process-wide asyncio engine for concurrent workloads, needs SQLAlchemy 1.4+ and asyncpg
+
+    Args:
+        kwargs: extra arguments for create_async_engine, e.g. pool_size, and statement_timeout in milliseconds
+    """
+    try:
+        from sqlalchemy.ext.asyncio import create_async_engine
+    except ImportError as e:
+        raise ImportError("The async engine needs SQLAlchemy 1.4 or newer and asyncpg") from e
+    key = ('async', repr(sorted(kwargs.items())))
+    engine = _engines.get(key)
+    if engine is not None:
+        return engine
+    data = load_config()
+    options, statement_timeout = _engine_options(data, kwargs)
+    if statement_timeout > 0:
+        options.setdefault('connect_args', {}).setdefault('server_settings', {})['statement_timeout'] = str(statement_timeout)
+    with _engines_lock:
+        if key not in _engines:
+            _engines[key] = create_async_engine(_database_url(data, 'postgresql+asyncpg'), **options)
+            _usages[key] = _PoolUsage(_engines[key].sync_engine)
+        return _engines[key]
+
+def pool_stats() -> list:
+    """Connection pool usage of every engine created by get_engine and get_async_engine
+
+    Returns:
+        list: one dict per engine, with its pool size, the connections checked in, checked out and in overflow,
+            and the highest number of connections checked out at once
+    """
+    stats = []
+    with _engines_lock:
+        engines = list(_engines.items())
+    for key, engine in engines:
+        kind, arguments = key
+        pool = engine.pool if kind == 'sync' else engine.sync_engine.pool
+        stats.append({
+            'engine' : f'{kind} {arguments}',
+            'size' : pool.size(),
+            'checked_in' : pool.checkedin(),
+            'checked_out' : pool.checkedout(),
+            'overflow' : pool.overflow(),
+            'peak_checked_out' : _usages[key].peak
+        })
+    return stats
+
+def print_pool_stats():
+    for stats in pool_stats():
+        print(f"{stats['engine']}: size {stats['size']}, checked out {stats['checked_out']} (peak {stats['peak_checked_out']}), "
+            f"checked in {stats['checked_in']}, overflow {stats['overflow']}")
+
+def dispose_engines():
+    """Close the pooled connections of every engine, e.g. in a child process after a fork
+    """
+    with _engines_lock:
+        engines = list(_engines.items())
+        _engines.clear()
+        _usages.clear()
+    for (kind, _), engine in engines:
+        if kind == 'sync':
+            engine.dispose()
+        else:
+            engine.sync_engine.dispose()
+
+def copy_dataframe(connection, df, table : str, columns : list):
+    """Stream a DataFrame into a table with PostgreSQL COPY
+
+    Args:
+        connection: SQLAlchemy connection, the COPY runs inside its transaction
+        df (pd.DataFrame): data to copy
+        table (str): qualified name of the target table
+        columns (list): columns of df to copy, in the order of the target columns
+    """
+    buffer = io.StringIO()
+    df[columns].to_csv(buffer, index = False, header = False, date_format = '%Y-%m-%d')
+    buffer.seek(0)
+    cursor = connection.connection.cursor()
+    try:
+        cursor.copy_expert(f"COPY {table} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)", buffer)
+    finally:
+        cursor.close()
+
+def anti_join(df, other, keys : list):
+    """Keep the rows of df whose keys do not appear in other
+
+    Args:
+        df (pd.DataFrame): left frame
+        other (pd.DataFrame): right frame, only the key columns are used
+        keys (list): columns to join on
+
+    Returns:
+        pd.DataFrame: rows of df without a match in other
+    """
+    merged = df.merge(other[keys].drop_duplicates(), on = keys, how = 'left', indicator = True)
+    return merged[merged['_merge'] == 'left_only'].drop(columns = '_merge')
+
+def coalesce_date_ranges(ranges, key : str):
+    """Merge the overlapping and adjacent date ranges of every key
+
+    Args:
+        ranges (pd.DataFrame): key, first_date and last_date columns, both dates included
+        key (str): column grouping the ranges
+
+    Returns:
+        pd.DataFrame: disjoint ranges sorted by key and first_date
+    """
+    ranges = ranges.sort_values([key, 'first_date'], ignore_index = True)
+    reach = ranges.groupby(key)['last_date'].cummax().shift()
+    # a range starts a new island unless it begins at most one day after the furthest end seen so far
+    starts = (ranges[key] != ranges[key].shift()) | (ranges['first_date'] > reach + pd.Timedelta(days = 1))
+    islands = ranges.groupby(starts.cumsum())
+    return pd.DataFrame({
+        key : islands[key].first(),
+        'first_date' : islands['first_date'].min(),
+        'last_date' : islands['last_date'].max()
+    }).reset_index(drop = True)
+
+def in_ranges(values, starts, ends):
+    """Check which values fall in one of the disjoint ranges [starts[i], ends[i]], sorted by start
+
+    One binary search per value, instead of one comparison per value and range.
+
+    Returns:
+        np.ndarray: boolean mask of values
+    """
+    values = np.asarray(values)
+    if len(starts) == 0:
+        return np.zeros(len(values), dtype = bool)
+    i = np.searchsorted(starts, values, side = 'right') - 1
+    return (i >= 0) & (values <= np.asarray(ends)[np.maximum(i, 0)])